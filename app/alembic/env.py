@@ -3,7 +3,7 @@ from logging.config import fileConfig
 
 from alembic import context
 from server.config import Settings
-from server.db import Base
+from server.db import Base, load_models
 from sqlalchemy import pool
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
@@ -21,6 +21,7 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
+load_models()
 target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
@@ -0,0 +1,45 @@
+"""Permission lookup index
+
+Revision ID: 3b8e41d07c26
+Revises: 97c5e0484442
+Create Date: 2026-10-17 17:31:08.114592
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3b8e41d07c26"
+down_revision: Union[str, None] = "97c5e0484442"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # One live grant per business and app; soft-deleted rows are kept as
+    # history, so a permission can be granted again after a revoke
+    op.create_index(
+        op.f("ix_permission_business_id_app_id"),
+        "permission",
+        ["business_id", "app_id"],
+        unique=True,
+        postgresql_where=sa.text("NOT is_deleted"),
+        sqlite_where=sa.text("NOT is_deleted"),
+    )
+    # The composite index leads with business_id
+    op.drop_index(op.f("ix_permission_business_id"), table_name="permission")
+    # Incremental refresh of the permission cache
+    op.create_index(
+        op.f("ix_permission_updated_at"), "permission", ["updated_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_permission_updated_at"), table_name="permission")
+    op.create_index(
+        op.f("ix_permission_business_id"), "permission", ["business_id"], unique=False
+    )
+    op.drop_index(op.f("ix_permission_business_id_app_id"), table_name="permission")
@@ -0,0 +1,32 @@
+"""Wallet hold expiry index
+
+Revision ID: 51a1e724fed1
+Revises: e2f15330aaa9
+Create Date: 2026-10-17 14:02:27.904311
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "51a1e724fed1"
+down_revision: Union[str, None] = "e2f15330aaa9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Expiry sweeps scan (status = active, expires_at <= now) as one range
+    op.create_index(
+        op.f("ix_wallethold_status_expires_at"),
+        "wallethold",
+        ["status", "expires_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_wallethold_status_expires_at"), table_name="wallethold")
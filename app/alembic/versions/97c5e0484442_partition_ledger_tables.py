@@ -0,0 +1,87 @@
+"""Partition ledger tables by created_at
+
+Revision ID: 97c5e0484442
+Revises: e1736021034b
+Create Date: 2026-10-17 16:48:55.602417
+
+Turns transaction and wallethold into TimescaleDB hypertables chunked on
+created_at and enables compression of old transaction chunks. Only runs on
+Postgres with the timescaledb extension available; elsewhere it is a no-op.
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "97c5e0484442"
+down_revision: Union[str, None] = "e1736021034b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+chunk_interval = "7 days"
+compress_after = "30 days"
+
+
+def timescale_available() -> bool:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return False
+    return bool(
+        bind.execute(
+            sa.text(
+                "SELECT 1 FROM pg_available_extensions WHERE name = 'timescaledb'"
+            )
+        ).scalar()
+    )
+
+
+def partition(table: str) -> None:
+    # Unique constraints must include the partition column
+    op.drop_constraint(f"{table}_pkey", table, type_="primary")
+    op.create_primary_key(f"{table}_pkey", table, ["uid", "created_at"])
+    op.drop_index(op.f(f"ix_{table}_uid"), table_name=table)
+    op.create_index(op.f(f"ix_{table}_uid"), table, ["uid"], unique=False)
+
+    op.execute(
+        f"SELECT create_hypertable('\"{table}\"', 'created_at', "
+        f"chunk_time_interval => INTERVAL '{chunk_interval}', "
+        f"create_default_indexes => false, migrate_data => true)"
+    )
+
+
+def upgrade() -> None:
+    if not timescale_available():
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS timescaledb")
+    partition("transaction")
+    partition("wallethold")
+
+    # Ledger rows are append-only; holds still change status, so only the
+    # ledger is compressed. Segmenting by wallet keeps per-wallet history
+    # reads on compressed chunks cheap.
+    op.execute(
+        """
+        ALTER TABLE "transaction" SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = 'wallet_id',
+            timescaledb.compress_orderby = 'created_at DESC, uid DESC'
+        )
+        """
+    )
+    op.execute(
+        f"SELECT add_compression_policy('\"transaction\"', "
+        f"INTERVAL '{compress_after}')"
+    )
+
+
+def downgrade() -> None:
+    if not timescale_available():
+        return
+    raise RuntimeError(
+        "Hypertables cannot be converted back in place; "
+        "restore transaction and wallethold from a dump instead"
+    )
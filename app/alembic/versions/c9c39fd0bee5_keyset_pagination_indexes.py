@@ -0,0 +1,46 @@
+"""Keyset pagination indexes
+
+Revision ID: c9c39fd0bee5
+Revises: 7c5f4fb00a5a
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c9c39fd0bee5"
+down_revision: Union[str, None] = "7c5f4fb00a5a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# BaseEntity leads the composite with the scope columns a model filters on
+# (user_id, business_name). None of these tables has either, so each index is
+# just (created_at, uid), matching the model's ix_<table>_created_at_uid.
+tables = [
+    "application",
+    "business",
+    "permission",
+    "proposal",
+    "wallet",
+    "transaction",
+    "wallethold",
+]
+
+
+def upgrade() -> None:
+    for table in tables:
+        op.create_index(
+            op.f(f"ix_{table}_created_at_uid"),
+            table,
+            ["created_at", "uid"],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    for table in reversed(tables):
+        op.drop_index(op.f(f"ix_{table}_created_at_uid"), table_name=table)
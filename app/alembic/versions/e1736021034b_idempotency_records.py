@@ -0,0 +1,64 @@
+"""Idempotency records
+
+Revision ID: e1736021034b
+Revises: 51a1e724fed1
+Create Date: 2026-10-17 15:21:09.114862
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e1736021034b"
+down_revision: Union[str, None] = "51a1e724fed1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "idempotencyrecord",
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("request_hash", sa.String(length=64), nullable=False),
+        sa.Column("status_code", sa.Integer(), nullable=True),
+        sa.Column("response_body", sa.LargeBinary(), nullable=True),
+        sa.Column("uid", sa.Uuid(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("is_deleted", sa.Boolean(), nullable=False),
+        sa.Column("meta_data", sa.JSON(), nullable=True),
+        sa.PrimaryKeyConstraint("uid"),
+    )
+    op.create_index(
+        op.f("ix_idempotencyrecord_key"), "idempotencyrecord", ["key"], unique=True
+    )
+    op.create_index(
+        op.f("ix_idempotencyrecord_created_at"),
+        "idempotencyrecord",
+        ["created_at"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_idempotencyrecord_created_at_uid"),
+        "idempotencyrecord",
+        ["created_at", "uid"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_idempotencyrecord_uid"), "idempotencyrecord", ["uid"], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_idempotencyrecord_uid"), table_name="idempotencyrecord")
+    op.drop_index(
+        op.f("ix_idempotencyrecord_created_at_uid"), table_name="idempotencyrecord"
+    )
+    op.drop_index(
+        op.f("ix_idempotencyrecord_created_at"), table_name="idempotencyrecord"
+    )
+    op.drop_index(op.f("ix_idempotencyrecord_key"), table_name="idempotencyrecord")
+    op.drop_table("idempotencyrecord")
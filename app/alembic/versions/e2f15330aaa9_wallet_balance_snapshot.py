@@ -0,0 +1,47 @@
+"""Wallet balance snapshot
+
+Revision ID: e2f15330aaa9
+Revises: c9c39fd0bee5
+Create Date: 2026-10-17 11:40:03.528817
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e2f15330aaa9"
+down_revision: Union[str, None] = "c9c39fd0bee5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "wallet",
+        sa.Column("balance", sa.Numeric(), nullable=False, server_default="0"),
+    )
+    # Ledger rows per wallet, for the backfill below and reconciliation
+    op.create_index(
+        op.f("ix_transaction_wallet_id_created_at"),
+        "transaction",
+        ["wallet_id", "created_at", "uid"],
+        unique=False,
+    )
+    op.execute(
+        """
+        UPDATE wallet SET balance = COALESCE((
+            SELECT SUM(t.amount) FROM "transaction" t
+            WHERE t.wallet_id = wallet.uid AND t.is_deleted = false
+        ), 0)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_transaction_wallet_id_created_at"), table_name="transaction"
+    )
+    op.drop_column("wallet", "balance")
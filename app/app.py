@@ -1,6 +1,11 @@
+import time
 from pathlib import Path
 
-from server.server import app
+started = time.perf_counter()
+from server import metrics  # noqa: E402
+from server.server import app  # noqa: E402
+
+metrics.startup["imports"] = time.perf_counter() - started
 
 __all__ = ["app"]
 
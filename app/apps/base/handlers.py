@@ -1,5 +1,7 @@
 from typing import Callable, Optional, Type, TypeVar
 
+import pydantic
+from core.exceptions import BaseHTTPException
 from fastapi import Request
 from usso import UserData
 
@@ -19,6 +21,38 @@ def create_dto(cls: Type[OT]) -> Callable:
     return dto
 
 
+def create_batch_dto(cls: Type[OT]) -> Callable:
+    async def dto(
+        request: Request, user: Optional[UserData] = None, **kwargs
+    ) -> list[OT]:
+        form_data = await request.json()
+        if not isinstance(form_data, list):
+            raise BaseHTTPException(
+                status_code=422,
+                error="invalid_batch",
+                message="Batch body must be a list of items",
+            )
+
+        # Validate the whole batch before anything touches the database
+        items, errors = [], []
+        for index, data in enumerate(form_data):
+            if user and isinstance(data, dict):
+                data["user_id"] = user.uid
+            try:
+                items.append(cls.model_validate(data))
+            except pydantic.ValidationError as e:
+                errors.append(f"{index}: {e.errors()[0]['msg']}")
+        if errors:
+            raise BaseHTTPException(
+                status_code=422,
+                error="invalid_batch",
+                message="; ".join(errors),
+            )
+        return items
+
+    return dto
+
+
 def update_dto(cls: Type[OT]) -> Callable:
     async def dto(
         request: Request, item: OT, user: Optional[UserData] = None, **kwargs
@@ -0,0 +1,190 @@
+"""Idempotency-Key support for POST endpoints.
+
+The first request for a key runs and stores its response in an
+idempotencyrecord row, committed in the same transaction as the model rows
+it wrote, so a crash leaves neither behind. Retries replay the stored
+response from the in-process LRU, bounded by total body bytes, or from the
+table, without touching the model tables. Concurrent duplicates in the same
+worker wait on the original execution; in other workers they block on the
+record's unique key until the original commits, then replay it.
+"""
+
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from core.exceptions import BaseHTTPException
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from server.config import Settings
+from sqlalchemy import LargeBinary, String, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+from utils.cache import TTLCache
+
+from .models import BaseEntity
+
+
+class IdempotencyRecord(BaseEntity):
+    key: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    request_hash: Mapped[str] = mapped_column(String(64))
+    status_code: Mapped[int | None]
+    response_body: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+
+
+# key -> (request_hash, status_code, body) of completed requests
+completed = TTLCache(
+    maxsize=Settings.idempotency_cache_size,
+    ttl=Settings.idempotency_ttl,
+    maxweight=Settings.idempotency_cache_bytes,
+    weigh=lambda stored: len(stored[2] or b""),
+)
+in_flight: dict[str, asyncio.Future] = {}
+
+
+def remember(key: str, stored: tuple) -> None:
+    # Large bodies, e.g. of /batch, stay in the table only
+    if len(stored[2] or b"") <= Settings.idempotency_cache_max_body:
+        completed.set(key, stored)
+
+
+def replay(request_hash: str, stored: tuple) -> Response:
+    stored_hash, status_code, body = stored
+    if stored_hash != request_hash:
+        raise BaseHTTPException(
+            status_code=422,
+            error="idempotency_key_reused",
+            message="Idempotency-Key was already used with a different request",
+        )
+    return Response(
+        body,
+        status_code=status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def in_progress() -> BaseHTTPException:
+    return BaseHTTPException(
+        status_code=409,
+        error="idempotency_in_progress",
+        message="A request with this Idempotency-Key is still in progress",
+    )
+
+
+def age(record: IdempotencyRecord) -> timedelta:
+    created_at = record.created_at
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - created_at
+
+
+async def execute(
+    request: Request,
+    session: AsyncSession,
+    user,
+    call: Callable[[], Awaitable],
+    status_code: int = 200,
+):
+    """Run `call` at most once per Idempotency-Key header value.
+
+    `call` must leave its writes uncommitted; they are committed here,
+    together with the stored response when the request carries a key.
+    """
+    header = request.headers.get("idempotency-key")
+    if not header:
+        response = await call()
+        await session.commit()
+        return response
+
+    user_id = user.uid if user else ""
+    scope = f"{user_id}:{request.method}:{request.url.path}:{header}"
+    key = hashlib.sha256(scope.encode()).hexdigest()
+    request_hash = hashlib.sha256(await request.body()).hexdigest()
+
+    stored = completed.get(key)
+    if stored is not None:
+        return replay(request_hash, stored)
+
+    future = in_flight.get(key)
+    if future is not None:
+        return replay(request_hash, await asyncio.shield(future))
+
+    future = in_flight[key] = asyncio.get_running_loop().create_future()
+    try:
+        response = await execute_once(session, key, request_hash, call, status_code)
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody is waiting
+        raise
+    else:
+        stored = (request_hash, response.status_code, response.body)
+        future.set_result(stored)
+        return response
+    finally:
+        del in_flight[key]
+
+
+async def execute_once(
+    session: AsyncSession,
+    key: str,
+    request_hash: str,
+    call: Callable[[], Awaitable],
+    status_code: int,
+) -> Response:
+    result = await session.execute(
+        select(IdempotencyRecord).filter(IdempotencyRecord.key == key)
+    )
+    record = result.scalar_one_or_none()
+    if record is not None:
+        ttl = timedelta(seconds=Settings.idempotency_ttl)
+        if record.status_code is not None and age(record) <= ttl:
+            return stored_response(key, request_hash, record)
+        # Expired, or pending from an older release: the key is free again
+        await session.delete(record)
+        await session.flush()
+
+    # Flushing the record takes the unique key for this transaction. A
+    # duplicate in another worker blocks here until that commits or rolls back.
+    record = IdempotencyRecord(key=key, request_hash=request_hash)
+    session.add(record)
+    try:
+        await session.flush()
+    except IntegrityError:
+        await session.rollback()
+        return await committed_response(session, key, request_hash)
+
+    try:
+        response = await call()
+        if not isinstance(response, Response):
+            response = JSONResponse(
+                jsonable_encoder(response), status_code=status_code
+            )
+        record.status_code = response.status_code
+        record.response_body = response.body
+        await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+    remember(key, (request_hash, response.status_code, response.body))
+    return response
+
+
+def stored_response(key: str, request_hash: str, record: IdempotencyRecord):
+    stored = (record.request_hash, record.status_code, record.response_body)
+    remember(key, stored)
+    return replay(request_hash, stored)
+
+
+async def committed_response(session: AsyncSession, key: str, request_hash: str):
+    """Replay the execution that won the key, once it has committed."""
+    result = await session.execute(
+        select(IdempotencyRecord).filter(IdempotencyRecord.key == key)
+    )
+    record = result.scalar_one_or_none()
+    if record is None or record.status_code is None:
+        raise in_progress()
+    return stored_response(key, request_hash, record)
@@ -2,25 +2,89 @@ import uuid
 from datetime import datetime, timezone
 from typing import Any
 
-from sqlalchemy import JSON, event, select
+from core.exceptions import BaseHTTPException
+from server import ledger
+from server.config import Settings
+from sqlalchemy import (
+    JSON,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    UniqueConstraint,
+    bindparam,
+    event,
+    insert,
+    select,
+    text,
+    tuple_,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
 from sqlalchemy.orm import Mapped, declared_attr, mapped_column
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.sql import func
+from utils.cache import TTLCache
 
 # Base = declarative_base()
 
 
+def utcnow() -> datetime:
+    # Timestamp columns are naive DateTime() holding UTC; asyncpg rejects
+    # aware values for them
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Convert an aware datetime to the naive UTC the columns hold."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# Exact totals keyed by (table, user_id, business_name, is_deleted)
+count_cache = TTLCache(
+    maxsize=Settings.count_cache_size, ttl=Settings.count_cache_ttl
+)
+
+
 @as_declarative()
 class BaseEntity:
     id: Any
     __name__: str
     __abstract__ = True
+    # Fetch any server-generated values with RETURNING instead of a refresh
+    __mapper_args__ = {"eager_defaults": True}
+    # Planner row estimate for the whole table, used by estimated_count
+    estimate_count_sql = (
+        "SELECT reltuples::bigint FROM pg_class "
+        "WHERE relname = :table AND relkind IN ('r', 'p')"
+    )
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Scope filters are fixed per class, so decide them at definition time
+        cls._user_scoped = hasattr(cls, "user_id")
+        cls._business_scoped = hasattr(cls, "business_name")
+        cls._statements = {}
 
     @declared_attr
     def __tablename__(cls) -> str:
         return cls.__name__.lower()
 
+    @declared_attr
+    def __table_args__(cls):
+        # Composite index backing keyset pagination: the scope columns every
+        # list query filters on by equality, then (created_at, uid), so a page
+        # is one range scan in order instead of a sort of the whole scope
+        columns = [
+            *(["user_id"] if cls._user_scoped else []),
+            *(["business_name"] if cls._business_scoped else []),
+            "created_at",
+            "uid",
+        ]
+        return (Index(f"ix_{cls.__tablename__}_{'_'.join(columns)}", *columns),)
+
     uid: Mapped[uuid.UUID] = mapped_column(
         primary_key=True,
         default=uuid.uuid4,
@@ -28,11 +92,12 @@ class BaseEntity:
         index=True,
     )
     created_at: Mapped[datetime] = mapped_column(
-        default=lambda: datetime.now(timezone.utc),
+        default=utcnow,
         index=True,
     )
     updated_at: Mapped[datetime] = mapped_column(
-        default=lambda: datetime.now(timezone.utc), onupdate=func.now()
+        default=utcnow,
+        onupdate=utcnow,
     )
     is_deleted: Mapped[bool] = mapped_column(default=False)
     meta_data: Mapped[dict | None] = mapped_column(JSON, nullable=True)
@@ -46,19 +111,100 @@ class BaseEntity:
         user_id: uuid.UUID = None,
         business_name: str = None,
         is_deleted: bool = False,
+        for_update: bool = False,
+        columns: list[str] | None = None,
     ):
-        base_query = [cls.is_deleted == is_deleted, cls.uid == uid]
-
-        if hasattr(cls, "user_id"):
-            base_query.append(cls.user_id == user_id)
-        if hasattr(cls, "business_name"):
-            base_query.append(cls.business_name == business_name)
-
-        query = select(cls).filter(*base_query)
+        if not for_update and not columns:
+            params = cls._scope_params(user_id, business_name, is_deleted)
+            params["uid"] = uid
+            result = await session.execute(cls._statement("get"), params)
+            return result.scalar_one_or_none()
+
+        base_query = cls._base_filters(user_id, business_name, is_deleted)
+        base_query.append(cls.uid == uid)
+
+        query = cls._select(columns).filter(*base_query)
+        if for_update:
+            # Row lock held until the caller's transaction commits
+            query = query.with_for_update()
         result = await session.execute(query)
+        if columns:
+            return result.one_or_none()
         item = result.scalar_one_or_none()
         return item
 
+    @classmethod
+    def _statement(cls, name: str):
+        """Statement for one of the hot default query shapes, built once.
+
+        Every value is a bound parameter, so executions reuse one entry of
+        SQLAlchemy's compiled cache instead of rebuilding the select.
+        """
+        statement = cls._statements.get(name)
+        if statement is None:
+            statement = cls._statements[name] = cls._build_statement(name)
+        return statement
+
+    @classmethod
+    def _build_statement(cls, name: str):
+        scope = [cls.is_deleted == bindparam("is_deleted")]
+        if cls._user_scoped:
+            scope.append(cls.user_id == bindparam("user_id"))
+        if cls._business_scoped:
+            scope.append(cls.business_name == bindparam("business_name"))
+        order = (cls.created_at.desc(), cls.uid.desc())
+        offset = bindparam("offset", type_=Integer)
+        limit = bindparam("limit", type_=Integer)
+
+        if name == "get":
+            return select(cls).where(*scope, cls.uid == bindparam("uid"))
+        if name == "count":
+            return select(func.count()).select_from(cls).where(*scope)
+        if name == "list":
+            return (
+                select(cls).where(*scope).order_by(*order).offset(offset).limit(limit)
+            )
+        if name == "list_total":
+            return (
+                select(cls, func.count().over().label("total"))
+                .where(*scope)
+                .order_by(*order)
+                .offset(offset)
+                .limit(limit)
+            )
+        if name == "list_cursor":
+            created_at = bindparam("cursor_created_at", type_=cls.created_at.type)
+            uid = bindparam("cursor_uid", type_=cls.uid.type)
+            return (
+                select(cls)
+                .where(
+                    *scope,
+                    tuple_(cls.created_at, cls.uid) < tuple_(created_at, uid),
+                    cls.created_at <= created_at,
+                )
+                .order_by(*order)
+                .limit(limit)
+            )
+        raise KeyError(name)
+
+    @classmethod
+    def _scope_params(
+        cls, user_id: uuid.UUID, business_name: str, is_deleted: bool
+    ) -> dict:
+        params = {"is_deleted": is_deleted}
+        if cls._user_scoped:
+            params["user_id"] = user_id
+        if cls._business_scoped:
+            params["business_name"] = business_name
+        return params
+
+    @classmethod
+    def _select(cls, columns: list[str] | None = None):
+        """Select whole entities, or only the given columns as rows."""
+        if not columns:
+            return select(cls)
+        return select(*[getattr(cls, column) for column in columns])
+
     @classmethod
     async def list_items(
         cls,
@@ -68,26 +214,85 @@ class BaseEntity:
         offset: int = 0,
         limit: int = 10,
         is_deleted: bool = False,
+        cursor: tuple[datetime, uuid.UUID] | None = None,
+        columns: list[str] | None = None,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        filters: list | None = None,
     ):
-        base_query = [cls.is_deleted == is_deleted]
+        if not columns and not filters and created_from is None and created_to is None:
+            params = cls._scope_params(user_id, business_name, is_deleted)
+            params["limit"] = limit
+            if cursor is None:
+                params["offset"] = offset
+                statement = cls._statement("list")
+            else:
+                params["cursor_created_at"], params["cursor_uid"] = cursor
+                statement = cls._statement("list_cursor")
+            result = await session.execute(statement, params)
+            return result.scalars().all()
+
+        base_query = cls._base_filters(
+            user_id, business_name, is_deleted, created_from, created_to, filters
+        )
 
-        if hasattr(cls, "user_id"):
-            base_query.append(cls.user_id == user_id)
-        if hasattr(cls, "business_name"):
-            base_query.append(cls.business_name == business_name)
+        if cursor is not None:
+            # Keyset mode: continue strictly after the last seen row. The plain
+            # created_at bound lets partitioned tables prune newer partitions.
+            base_query.append(tuple_(cls.created_at, cls.uid) < tuple_(*cursor))
+            base_query.append(cls.created_at <= cursor[0])
+            offset = 0
 
         items_query = (
-            select(cls)
+            cls._select(columns)
             .filter(*base_query)
-            .order_by(cls.created_at.desc())
+            .order_by(cls.created_at.desc(), cls.uid.desc())
             .offset(offset)
             .limit(limit)
         )
 
         items_result = await session.execute(items_query)
+        if columns:
+            return items_result.all()
         items = items_result.scalars().all()
         return items
 
+    @classmethod
+    async def stream_items(
+        cls,
+        session: AsyncSession,
+        user_id: uuid.UUID = None,
+        business_name: str = None,
+        is_deleted: bool = False,
+        columns: list[str] | None = None,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        filters: list | None = None,
+        batch_size: int = 1000,
+    ):
+        """Yield every matching item, oldest first, in batches of `batch_size`.
+
+        Rows come from a server-side cursor, so memory is bounded by one batch
+        whatever the row count. The caller must keep the session open while
+        iterating.
+        """
+        base_query = cls._base_filters(
+            user_id, business_name, is_deleted, created_from, created_to, filters
+        )
+        query = (
+            cls._select(columns)
+            .filter(*base_query)
+            .order_by(cls.created_at, cls.uid)
+            .execution_options(yield_per=batch_size)
+        )
+        result = await session.stream(query)
+        if not columns:
+            result = result.scalars()
+        # The identity map only holds weak references, so entities of a written
+        # batch are freed as the next one is fetched
+        async for batch in result.partitions():
+            yield batch
+
     @classmethod
     async def total_count(
         cls,
@@ -95,23 +300,157 @@ class BaseEntity:
         user_id: uuid.UUID = None,
         business_name: str = None,
         is_deleted: bool = False,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        filters: list | None = None,
     ):
         # Create the base query
+        base_query = cls._base_filters(
+            user_id, business_name, is_deleted, created_from, created_to, filters
+        )
+
+        # Filtered counts are ad hoc, only whole-scope totals are cached
+        cache_key = None
+        if created_from is None and created_to is None and not filters:
+            cache_key = cls._count_key(user_id, business_name, is_deleted)
+            total = count_cache.get(cache_key)
+            if total is not None:
+                return total
+
+            total_result = await session.execute(
+                cls._statement("count"),
+                cls._scope_params(user_id, business_name, is_deleted),
+            )
+        else:
+            # Query for getting the total count of items
+            total_count_query = select(func.count()).filter(*base_query)
+            total_result = await session.execute(total_count_query)
+        total = total_result.scalar()
+
+        if cache_key is not None:
+            count_cache.set(cache_key, total)
+        return total
+
+    @classmethod
+    def _base_filters(
+        cls,
+        user_id: uuid.UUID = None,
+        business_name: str = None,
+        is_deleted: bool = False,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        filters: list | None = None,
+    ) -> list:
         base_query = [cls.is_deleted == is_deleted]
 
         # Apply user_id filtering if the model has a user_id attribute
-        if hasattr(cls, "user_id"):
+        if cls._user_scoped:
             base_query.append(cls.user_id == user_id)
-        if hasattr(cls, "business_name"):
+        if cls._business_scoped:
             base_query.append(cls.business_name == business_name)
 
-        # Query for getting the total count of items
-        total_count_query = select(func.count()).filter(*base_query)  # .subquery()
+        # Plain bounds on created_at, so time-partitioned tables get pruned
+        if created_from is not None:
+            base_query.append(cls.created_at >= naive_utc(created_from))
+        if created_to is not None:
+            base_query.append(cls.created_at < naive_utc(created_to))
+        if filters:
+            base_query.extend(filters)
+        return base_query
 
-        total_result = await session.execute(total_count_query)
-        total = total_result.scalar()
+    @classmethod
+    def indexed_columns(cls) -> dict:
+        """Columns leading an index, i.e. the ones a filter can seek on."""
+        columns = cls.__dict__.get("_indexed_columns")
+        if columns is None:
+            table = cls.__table__
+            leading = [index.columns for index in table.indexes]
+            leading += [
+                constraint.columns
+                for constraint in table.constraints
+                if isinstance(constraint, (PrimaryKeyConstraint, UniqueConstraint))
+            ]
+            columns = {cols[0].key: cols[0] for cols in leading if len(cols)}
+            cls._indexed_columns = columns
+        return columns
 
-        return total
+    @classmethod
+    def _count_key(
+        cls, user_id: uuid.UUID, business_name: str, is_deleted: bool
+    ) -> tuple:
+        return (
+            cls.__tablename__,
+            user_id if cls._user_scoped else None,
+            business_name if cls._business_scoped else None,
+            is_deleted,
+        )
+
+    @classmethod
+    def invalidate_count(cls, item: "BaseEntity"):
+        user_id = getattr(item, "user_id", None)
+        business_name = getattr(item, "business_name", None)
+        for is_deleted in (False, True):
+            count_cache.pop(cls._count_key(user_id, business_name, is_deleted))
+
+    @classmethod
+    def invalidate_count_on_commit(cls, session: AsyncSession, items: list):
+        """Drop cached totals once the caller commits the flushed items."""
+        scopes = {
+            (getattr(item, "user_id", None), getattr(item, "business_name", None))
+            for item in items
+        }
+
+        def invalidate(_):
+            for user_id, business_name in scopes:
+                for is_deleted in (False, True):
+                    count_cache.pop(cls._count_key(user_id, business_name, is_deleted))
+
+        event.listen(session.sync_session, "after_commit", invalidate, once=True)
+
+    @classmethod
+    async def estimated_count(
+        cls,
+        session: AsyncSession,
+        user_id: uuid.UUID = None,
+        business_name: str = None,
+        is_deleted: bool = False,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        filters: list | None = None,
+    ):
+        # Planner statistics only describe the whole table, so scoped models,
+        # time ranges and other dialects fall back to an exact count
+        if (
+            session.get_bind().dialect.name != "postgresql"
+            or cls._user_scoped
+            or cls._business_scoped
+            or created_from is not None
+            or created_to is not None
+            or filters
+        ):
+            return await cls.total_count(
+                session,
+                user_id=user_id,
+                business_name=business_name,
+                is_deleted=is_deleted,
+                created_from=created_from,
+                created_to=created_to,
+                filters=filters,
+            )
+
+        result = await session.execute(
+            text(cls.estimate_count_sql), {"table": cls.__tablename__}
+        )
+        estimate = result.scalar()
+        if estimate is None or estimate < 0:
+            # Table was never analyzed
+            return await cls.total_count(
+                session,
+                user_id=user_id,
+                business_name=business_name,
+                is_deleted=is_deleted,
+            )
+        return estimate
 
     @classmethod
     async def list_total_combined(
@@ -122,43 +461,140 @@ class BaseEntity:
         offset: int = 0,
         limit: int = 10,
         is_deleted: bool = False,
+        cursor: tuple[datetime, uuid.UUID] | None = None,
+        count: str = "exact",
+        columns: list[str] | None = None,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        filters: list | None = None,
     ):
-        base_query = [cls.is_deleted == is_deleted]
-
-        if hasattr(cls, "user_id"):
-            base_query.append(cls.user_id == user_id)
-        if hasattr(cls, "business_name"):
-            base_query.append(cls.business_name == business_name)
-
-        total_count_query = select(func.count()).filter(*base_query)  # .subquery()
-
-        # Create the base query for fetching the items
-        items_query = (
-            select(cls)
-            .filter(*base_query)
-            .order_by(cls.created_at.desc())
-            .offset(offset)
-            .limit(limit)
-            # .subquery()
-        )
-
-        # Combine both queries into a single select statement
-        combined_query = select(
-            total_count_query.subquery().c[0].label("total"), items_query.subquery()
+        """Return a page of items and the total, in one statement when possible.
+
+        count is one of "exact", "estimated" or "none" (total is None).
+        """
+        query_filters = {
+            "created_from": created_from,
+            "created_to": created_to,
+            "filters": filters,
+        }
+        cache_key = None
+        if created_from is None and created_to is None and not filters:
+            cache_key = cls._count_key(user_id, business_name, is_deleted)
+
+        cached_total = None
+        if count == "exact" and cache_key is not None:
+            cached_total = count_cache.get(cache_key)
+
+        if count != "exact" or cursor is not None or cached_total is not None:
+            # A window count under a keyset predicate would only count the
+            # remaining rows, so cursor pages count separately
+            items = await cls.list_items(
+                session,
+                user_id=user_id,
+                business_name=business_name,
+                offset=offset,
+                limit=limit,
+                is_deleted=is_deleted,
+                cursor=cursor,
+                columns=columns,
+                **query_filters,
+            )
+            if count == "none":
+                return items, None
+            if count == "estimated":
+                count_method = cls.estimated_count
+            else:
+                count_method = cls.total_count
+            total = await count_method(
+                session,
+                user_id=user_id,
+                business_name=business_name,
+                is_deleted=is_deleted,
+                **query_filters,
+            )
+            return items, total
+
+        # The window count is evaluated before offset/limit are applied
+        if not columns and cache_key is not None:
+            params = cls._scope_params(user_id, business_name, is_deleted)
+            params.update(offset=offset, limit=limit)
+            result = await session.execute(cls._statement("list_total"), params)
+        else:
+            base_query = cls._base_filters(
+                user_id, business_name, is_deleted, created_from, created_to, filters
+            )
+            combined_query = (
+                cls._select(columns)
+                .add_columns(func.count().over().label("total"))
+                .filter(*base_query)
+                .order_by(cls.created_at.desc(), cls.uid.desc())
+                .offset(offset)
+                .limit(limit)
+            )
+            result = await session.execute(combined_query)
+        rows = result.all()
+        if rows:
+            total = rows[0].total
+            if cache_key is not None:
+                count_cache.set(cache_key, total)
+            if columns:
+                # Rows keep the extra total column, which schemas ignore
+                return rows, total
+            return [row[0] for row in rows], total
+
+        if offset == 0:
+            return [], 0
+        # Page past the end: no row carries the total
+        total = await cls.total_count(
+            session,
+            user_id=user_id,
+            business_name=business_name,
+            is_deleted=is_deleted,
+            **query_filters,
         )
-        # Execute the combined query
-        # result = await session.execute(combined_query)
-        # res2 = result.fetchall()
-        # res = result.scalars().all()
+        return [], total
 
     @classmethod
-    async def create_item(cls, session: AsyncSession, data: dict):
+    async def create_item(cls, session: AsyncSession, data: dict, commit: bool = True):
+        """Insert one row; with commit=False it is only flushed."""
         item = cls(**data)
         session.add(item)
+        if not commit:
+            await session.flush()
+            cls.invalidate_count_on_commit(session, [item])
+            return item
         await session.commit()
-        await session.refresh(item)
+        cls.invalidate_count(item)
         return item
 
+    @classmethod
+    async def create_items(
+        cls, session: AsyncSession, data: list[dict], commit: bool = True
+    ):
+        """Insert all rows with one multi-row INSERT ... RETURNING and commit once.
+
+        Either every row is stored or, on any error, none is. With commit=False
+        the rows are only flushed and the caller commits.
+        """
+        if not data:
+            return []
+        try:
+            result = await session.scalars(
+                insert(cls).returning(cls, sort_by_parameter_order=True), data
+            )
+            items = result.all()
+            if commit:
+                await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        if not commit:
+            cls.invalidate_count_on_commit(session, items)
+            return items
+        for item in items:
+            cls.invalidate_count(item)
+        return items
+
     @classmethod
     async def update_item(cls, session: AsyncSession, item: "BaseEntity", data: dict):
         # Todo: check data has valid and permitted keys
@@ -171,7 +607,8 @@ class BaseEntity:
                 setattr(item, key, value)
         session.add(item)
         await session.commit()
-        await session.refresh(item)
+        if "is_deleted" in data:
+            cls.invalidate_count(item)
         return item
 
     @classmethod
@@ -179,7 +616,7 @@ class BaseEntity:
         item.is_deleted = True
         session.add(item)
         await session.commit()
-        await session.refresh(item)
+        cls.invalidate_count(item)
         return item
 
 
@@ -202,6 +639,109 @@ class BusinessOwnedEntity(OwnedEntity, BusinessEntity):
     __abstract__ = True
 
 
+class LedgerEntity(BaseEntity):
+    """Append-only ledger row that moves its wallet's balance snapshot.
+
+    Subclasses declare wallet_id, amount and balance columns. Inserts and
+    soft deletes update wallet.balance in the same transaction (see
+    server.ledger), and balance and created_at are always set by the insert.
+    """
+
+    __abstract__ = True
+    # Posted rows are corrected by new rows, not edited
+    ledger_fields = {"wallet_id", "amount", "balance", "created_at", "is_deleted"}
+
+    @classmethod
+    async def create_item(cls, session: AsyncSession, data: dict, commit: bool = True):
+        items = await cls.create_items(session, [data], commit=commit)
+        return items[0]
+
+    @classmethod
+    async def create_items(
+        cls, session: AsyncSession, data: list[dict], commit: bool = True
+    ):
+        if not data:
+            return []
+        try:
+            data = await ledger.post(session, [dict(row) for row in data])
+        except Exception:
+            await session.rollback()
+            raise
+        return await super().create_items(session, data, commit=commit)
+
+    @classmethod
+    async def update_item(cls, session: AsyncSession, item: "BaseEntity", data: dict):
+        if cls.ledger_fields & data.keys():
+            raise BaseHTTPException(
+                status_code=400,
+                error="ledger_row_immutable",
+                message=f"{', '.join(sorted(cls.ledger_fields & data.keys()))} "
+                "of a ledger row cannot change, post a correcting row instead",
+            )
+        return await super().update_item(session, item, data)
+
+    @classmethod
+    async def delete_item(cls, session: AsyncSession, item: "BaseEntity"):
+        try:
+            # Only the delete that flips the flag reverses the amount
+            result = await session.execute(
+                update(cls)
+                .where(cls.uid == item.uid, cls.is_deleted.is_(False))
+                .values(is_deleted=True, updated_at=utcnow())
+                .returning(cls.updated_at)
+            )
+            deleted = result.first()
+            if deleted is not None:
+                await ledger.reverse(session, item.wallet_id, item.amount)
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        set_committed_value(item, "is_deleted", True)
+        if deleted is not None:
+            set_committed_value(item, "updated_at", deleted.updated_at)
+        cls.invalidate_count(item)
+        return item
+
+
+class TimePartitionedEntity(BaseEntity):
+    """Append-only entity stored in created_at partitions (TimescaleDB chunks).
+
+    Unique constraints on a partitioned table must contain the partition key,
+    so the primary key is (uid, created_at) and uid alone is only indexed.
+    The database therefore no longer rejects a repeated uid, so inserts drop
+    any uid passed in and always take a fresh uuid4.
+    """
+
+    __abstract__ = True
+    estimate_count_sql = "SELECT approximate_row_count(CAST(:table AS regclass))"
+
+    uid: Mapped[uuid.UUID] = mapped_column(
+        primary_key=True,
+        default=uuid.uuid4,
+        index=True,
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        primary_key=True,
+        default=utcnow,
+        index=True,
+    )
+
+    @classmethod
+    async def create_item(cls, session: AsyncSession, data: dict, commit: bool = True):
+        data = {key: value for key, value in data.items() if key != "uid"}
+        return await super().create_item(session, data, commit=commit)
+
+    @classmethod
+    async def create_items(
+        cls, session: AsyncSession, data: list[dict], commit: bool = True
+    ):
+        data = [
+            {key: value for key, value in row.items() if key != "uid"} for row in data
+        ]
+        return await super().create_items(session, data, commit=commit)
+
+
 class ImmutableBase(BaseEntity):
     __abstract__ = True
 
@@ -0,0 +1,93 @@
+"""Opt-in cache of retrieve responses, keyed by (model, uid, user scope).
+
+Entries hold the rendered JSON body and its ETag. The router invalidates an
+entry when the item is updated or deleted through it, and a wallet cache
+also when ledger writes or settlements move balances (server.ledger); the
+TTL bounds staleness from writes made elsewhere. The in-process backend only sees this
+worker's writes, so deployments with several workers that need tighter
+consistency should plug in a shared backend.
+"""
+
+import hashlib
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any
+
+from server.config import Settings
+from utils.cache import TTLCache
+
+from .models import BaseEntity
+
+
+class CacheBackend(ABC):
+    """Storage interface, async so a network store can implement it."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Any: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float) -> None: ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self, maxsize: int = Settings.response_cache_size):
+        self.cache = TTLCache(maxsize=maxsize)
+
+    async def get(self, key: str) -> Any:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self.cache.set(key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        self.cache.pop(key)
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        backend: CacheBackend | None = None,
+        ttl: float = Settings.response_cache_ttl,
+    ):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+
+    @staticmethod
+    def key(model: type[BaseEntity], uid: uuid.UUID, user_id) -> str:
+        # get_item only filters by user on user-scoped models
+        scope = user_id if model._user_scoped else ""
+        return f"{model.__tablename__}:{uid}:{scope}"
+
+    async def get(self, model, uid, user_id) -> tuple[bytes, str] | None:
+        return await self.backend.get(self.key(model, uid, user_id))
+
+    async def set(self, model, uid, user_id, body: bytes) -> str:
+        etag = make_etag(body)
+        await self.backend.set(self.key(model, uid, user_id), (body, etag), self.ttl)
+        return etag
+
+    async def invalidate(self, model, item: BaseEntity) -> None:
+        user_id = getattr(item, "user_id", None)
+        await self.backend.delete(self.key(model, item.uid, user_id))
+
+    async def invalidate_uids(self, model, uids) -> None:
+        """Drop the entries of rows changed outside the router."""
+        for uid in uids:
+            await self.backend.delete(self.key(model, uid, None))
@@ -1,23 +1,91 @@
+import csv
+import functools
+import io
+import json
+import operator
+import time
 import uuid
+from datetime import datetime
+from decimal import InvalidOperation
 from typing import Any, Generic, Type, TypeVar
 
 import singleton
 from core.exceptions import BaseHTTPException
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, create_model
+from server import auth, ledger, metrics
 from server.config import Settings
-from server.db import get_db_session
+from server.db import get_db_session, get_read_session, read_session
 from sqlalchemy import func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from utils.cache import TTLCache
 
-from .handlers import create_dto, update_dto
-from .models import BaseEntity
-from .schemas import BaseEntitySchema, PaginatedResponse
+from . import idempotency
+from .handlers import create_batch_dto, create_dto, update_dto
+from .models import BaseEntity, naive_utc
+from .response_cache import ResponseCache, etag_matches, make_etag
+from .schemas import (
+    BaseEntitySchema,
+    CountMode,
+    ExportFormat,
+    PaginatedResponse,
+    decode_cursor,
+    encode_cursor,
+)
 
 # Define a type variable
 T = TypeVar("T", bound=BaseEntity)
 TS = TypeVar("TS", bound=BaseEntitySchema)
 
+# Query parameters of the list and export routes that are not column filters
+list_params = {
+    "offset",
+    "limit",
+    "cursor",
+    "count",
+    "fields",
+    "created_from",
+    "created_to",
+}
+export_params = {"format", "fields", "created_from", "created_to"}
+filter_operators = {
+    "": operator.eq,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+
+def parse_filter_value(column, raw: str):
+    python_type = column.type.python_type
+    if python_type is bool:
+        return raw.lower() in ("1", "true")
+    if python_type is datetime:
+        return naive_utc(datetime.fromisoformat(raw))
+    return python_type(raw)
+
+
+def csv_chunk(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def csv_values(item, names: list[str]) -> list:
+    # Nested values, e.g. meta_data, go into a single cell as JSON
+    values = item.model_dump(mode="json")
+    return [
+        json.dumps(value) if isinstance(value, (dict, list)) else value
+        for value in (values[name] for name in names)
+    ]
+
+
+def ndjson_chunk(items) -> bytes:
+    return "".join(item.model_dump_json() + "\n" for item in items).encode()
+
 
 class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
     def __init__(
@@ -28,11 +96,32 @@ class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
         prefix: str = None,
         tags: list[str] = None,
         schema: Type[TS] = None,
+        count_mode: CountMode = CountMode.exact,
+        fast_serialization: bool = True,
+        response_cache: ResponseCache | None = None,
+        cache_auth: bool = True,
         **kwargs,
     ):
         self.model = model
         self.schema = schema
+        # Default for the count= query parameter; huge tables can skip the total
+        self.count_mode = count_mode
+        # Validate ORM rows once and write JSON bytes, skipping response_model
+        self.fast_serialization = fast_serialization
+        # Opt-in cache of retrieve responses for rarely changing models
+        self.response_cache = response_cache
+        if response_cache is not None and model.__tablename__ == ledger.wallet_table:
+            # Ledger writes and settlements move balances outside the router
+            ledger.balance_listeners.append(
+                functools.partial(response_cache.invalidate_uids, model)
+            )
+        # fields= sets -> (columns, schema, items adapter, page schema)
+        self.sparse_schemas = TTLCache(maxsize=256, ttl=24 * 3600)
+        # filter parameter names -> [(name, column, operator)]
+        self.filter_specs = TTLCache(maxsize=256, ttl=24 * 3600)
         self.user_dependency = user_dependency
+        # Reuse verified users per token instead of verifying every request
+        self.cache_auth = cache_auth
         if prefix is None:
             prefix = f"/{self.model.__name__.lower()}s"
         if tags is None:
@@ -44,8 +133,10 @@ class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
     @classmethod
     def config_schemas(cls, schema, **kwargs):
         cls.list_response_schema = PaginatedResponse[schema]
+        cls.list_items_adapter = TypeAdapter(list[schema])
         cls.retrieve_response_schema = schema
         cls.create_response_schema = schema
+        cls.create_items_adapter = TypeAdapter(list[schema])
         cls.update_response_schema = schema
         cls.delete_response_schema = schema
 
@@ -60,6 +151,13 @@ class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
             response_model=self.list_response_schema,
             status_code=200,
         )
+        self.router.add_api_route(
+            "/export",
+            self.export_items,
+            methods=["GET"],
+            response_class=StreamingResponse,
+            status_code=200,
+        )
         self.router.add_api_route(
             "/{uid:uuid}",
             self.retrieve_item,
@@ -74,6 +172,13 @@ class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
             response_model=self.create_response_schema,
             status_code=201,
         )
+        self.router.add_api_route(
+            "/batch",
+            self.create_items,
+            methods=["POST"],
+            response_model=list[self.create_response_schema],
+            status_code=201,
+        )
         self.router.add_api_route(
             "/{uid:uuid}",
             self.update_item,
@@ -89,39 +194,275 @@ class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
             # status_code=204,
         )
 
+    def sparse_schema(self, fields: str | None):
+        """Validate a fields= parameter and build its response schemas once."""
+        if not fields:
+            return None
+        requested = frozenset(f.strip() for f in fields.split(",") if f.strip())
+        sparse = self.sparse_schemas.get(requested)
+        if sparse is not None:
+            return sparse
+
+        allowed = self.model.__table__.columns.keys() & self.schema.model_fields.keys()
+        if not requested or not requested <= allowed:
+            raise BaseHTTPException(
+                status_code=400,
+                error="invalid_fields",
+                message=f"fields must be a subset of: {', '.join(sorted(allowed))}",
+            )
+
+        names = [name for name in self.schema.model_fields if name in requested]
+        schema = create_model(
+            f"{self.schema.__name__}Fields",
+            **{
+                name: (field.annotation, field)
+                for name, field in self.schema.model_fields.items()
+                if name in requested
+            },
+        )
+        # Keyset pagination needs created_at and uid even when not returned
+        columns = names + [c for c in ("created_at", "uid") if c not in requested]
+        sparse = (
+            columns,
+            schema,
+            TypeAdapter(list[schema]),
+            PaginatedResponse[schema],
+        )
+        self.sparse_schemas.set(requested, sparse)
+        return sparse
+
+    def filter_spec(self, names: tuple[str, ...]) -> list:
+        """Validate a combination of filter parameters once per combination.
+
+        Only columns leading an index are accepted, as `column=value` or
+        `column__gt|gte|lt|lte=value`; other columns and operators are a 400.
+        """
+        spec = self.filter_specs.get(names)
+        if spec is not None:
+            return spec
+
+        indexed = self.model.indexed_columns()
+        spec = []
+        for name in names:
+            column_name, _, op = name.partition("__")
+            column = indexed.get(column_name)
+            if (
+                column is None
+                or column_name in ("user_id", "business_name")
+                or op not in filter_operators
+            ):
+                filterable = sorted(set(indexed) - {"user_id", "business_name"})
+                raise BaseHTTPException(
+                    status_code=400,
+                    error="invalid_filter",
+                    message=f"Cannot filter on {name}, indexed columns are: "
+                    f"{', '.join(filterable)}",
+                )
+            spec.append((name, column, filter_operators[op]))
+        self.filter_specs.set(names, spec)
+        return spec
+
+    def parse_filters(self, request: Request, reserved: set[str]) -> list | None:
+        params = request.query_params
+        # Only parameters naming a model column are filters; anything else,
+        # e.g. a cache buster or tracking parameter, is ignored
+        columns = self.model.__table__.columns
+        names = tuple(
+            sorted(
+                name
+                for name in params
+                if name not in reserved and name.partition("__")[0] in columns
+            )
+        )
+        if not names:
+            return None
+
+        filters = []
+        for name, column, op in self.filter_spec(names):
+            try:
+                value = parse_filter_value(column, params[name])
+            except (ValueError, TypeError, InvalidOperation, NotImplementedError):
+                raise BaseHTTPException(
+                    status_code=400,
+                    error="invalid_filter",
+                    message=f"Invalid value for {name}",
+                )
+            # Values stay bound parameters, so each combination is one
+            # statement shape in SQLAlchemy's compiled cache
+            filters.append(op(column, value))
+        return filters
+
+    def serialize(self, schema, item, status_code: int = 200, sparse: bool = False):
+        start = time.perf_counter()
+        if self.fast_serialization or sparse:
+            response = Response(
+                schema.model_validate(item, from_attributes=True).model_dump_json(),
+                status_code=status_code,
+                media_type="application/json",
+            )
+        else:
+            response = schema(**item.__dict__)
+        metrics.record_serialization(time.perf_counter() - start)
+        return response
+
+    def serialize_page(self, rows, sparse=None, **page):
+        start = time.perf_counter()
+        if self.fast_serialization or sparse:
+            if sparse:
+                _, _, items_adapter, page_schema = sparse
+            else:
+                items_adapter = self.list_items_adapter
+                page_schema = self.list_response_schema
+            # One validation call for the whole page, straight from attributes
+            items = items_adapter.validate_python(rows, from_attributes=True)
+            response = Response(
+                page_schema.model_construct(items=items, **page).model_dump_json(),
+                media_type="application/json",
+            )
+        else:
+            items = [self.schema(**item.__dict__) for item in rows]
+            response = PaginatedResponse(items=items, **page)
+        metrics.record_serialization(time.perf_counter() - start)
+        return response
+
+    def etag_response(self, request: Request, body: bytes, etag: str) -> Response:
+        headers = {"ETag": etag}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+
     async def get_user(self, request: Request, *args, **kwargs):
         if self.user_dependency is None:
             return None
-        return await self.user_dependency(request)
+        if self.cache_auth:
+            return await auth.cached_user(self.user_dependency, request)
+        return await auth.call_dependency(self.user_dependency, request)
 
     async def list_items(
         self,
         request: Request,
         offset: int = Query(0, ge=0),
         limit: int = Query(10, ge=0, le=Settings.page_max_limit),
-        session: AsyncSession = Depends(get_db_session),
+        cursor: str | None = Query(None),
+        count: CountMode | None = Query(None),
+        fields: str | None = Query(None),
+        created_from: datetime | None = Query(None),
+        created_to: datetime | None = Query(None),
+        session: AsyncSession = Depends(get_read_session),
     ):
         user = await self.get_user(request)
         limit = max(1, min(limit, Settings.page_max_limit))
+        sparse = self.sparse_schema(fields)
+        filters = self.parse_filters(request, list_params)
 
-        items = [
-            self.schema(**item.__dict__)
-            for item in await self.model.list_items(
-                session, offset=offset, limit=limit, user_id=user.uid
-            )
-        ]
-        total = await self.model.total_count(session, user_id=user.uid)
-        return PaginatedResponse(items=items, offset=offset, limit=limit, total=total)
+        position = None
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except ValueError:
+                raise BaseHTTPException(
+                    status_code=400,
+                    error="invalid_cursor",
+                    message="Invalid pagination cursor",
+                )
+            offset = 0
+
+        rows, total = await self.model.list_total_combined(
+            session,
+            offset=offset,
+            limit=limit,
+            user_id=user.uid,
+            cursor=position,
+            count=count or self.count_mode,
+            columns=sparse[0] if sparse else None,
+            created_from=created_from,
+            created_to=created_to,
+            filters=filters,
+        )
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].uid)
+        return self.serialize_page(
+            rows,
+            sparse,
+            offset=offset,
+            limit=limit,
+            total=total,
+            next_cursor=next_cursor,
+        )
+
+    async def export_items(
+        self,
+        request: Request,
+        format: ExportFormat = Query(ExportFormat.ndjson),
+        fields: str | None = Query(None),
+        created_from: datetime | None = Query(None),
+        created_to: datetime | None = Query(None),
+    ):
+        """Stream every matching item as NDJSON or CSV, oldest first."""
+        user = await self.get_user(request)
+        user_id = user.uid if user else None
+        sparse = self.sparse_schema(fields)
+        filters = self.parse_filters(request, export_params)
+        if sparse:
+            columns, schema, items_adapter, _ = sparse
+        else:
+            columns, schema, items_adapter = None, self.schema, self.list_items_adapter
+        names = list(schema.model_fields)
+
+        async def body():
+            # The session lives as long as the body, not the handler. Each
+            # chunk is only fetched once the previous one was sent, so a slow
+            # client pauses the cursor instead of filling memory.
+            if format == ExportFormat.csv:
+                yield csv_chunk([names])
+            async with read_session(request) as session:
+                async for batch in self.model.stream_items(
+                    session,
+                    user_id=user_id,
+                    columns=columns,
+                    created_from=created_from,
+                    created_to=created_to,
+                    filters=filters,
+                    batch_size=Settings.export_batch_size,
+                ):
+                    items = items_adapter.validate_python(batch, from_attributes=True)
+                    if format == ExportFormat.csv:
+                        yield csv_chunk(csv_values(item, names) for item in items)
+                    else:
+                        yield ndjson_chunk(items)
+
+        filename = f"{self.model.__tablename__}.{format.value}"
+        if format == ExportFormat.csv:
+            media_type = "text/csv"
+        else:
+            media_type = "application/x-ndjson"
+        return StreamingResponse(
+            body(),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
 
     async def retrieve_item(
         self,
         request: Request,
         uid: uuid.UUID,
-        session: AsyncSession = Depends(get_db_session),
+        fields: str | None = Query(None),
     ):
         user = await self.get_user(request)
         user_id = user.uid if user else None
-        item = await self.model.get_item(session, uid, user_id)
+        sparse = self.sparse_schema(fields)
+        cache = None if sparse else self.response_cache
+        if cache is not None:
+            cached = await cache.get(self.model, uid, user_id)
+            if cached is not None:
+                return self.etag_response(request, *cached)
+
+        # Only check out a connection once the cache missed
+        async with read_session(request) as session:
+            item = await self.model.get_item(
+                session, uid, user_id, columns=sparse[0] if sparse else None
+            )
 
         if item is None:
             raise BaseHTTPException(
@@ -129,7 +470,21 @@ class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
                 error="item_not_found",
                 message=f"{self.model.__name__.capitalize()} not found",
             )
-        return self.retrieve_response_schema(**item.__dict__)
+        if sparse:
+            response = self.serialize(sparse[1], item, sparse=True)
+        else:
+            response = self.serialize(self.retrieve_response_schema, item)
+        if isinstance(response, Response):
+            body = response.body
+        else:
+            # Render the schema here too, so both modes get the ETag and cache
+            body = response.model_dump_json().encode()
+
+        if cache is not None:
+            etag = await cache.set(self.model, uid, user_id, body)
+        else:
+            etag = make_etag(body)
+        return self.etag_response(request, body, etag)
 
     async def create_item(
         self,
@@ -138,9 +493,45 @@ class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
         session: AsyncSession = Depends(get_db_session),
     ):
         user = await self.get_user(request)
-        item_data = await create_dto(self.schema)(request, user)
-        item = await self.model.create_item(session, item_data.model_dump())
-        return self.create_response_schema(**item.__dict__)
+
+        async def create():
+            item_data = await create_dto(self.schema)(request, user)
+            item = await self.model.create_item(
+                session, item_data.model_dump(), commit=False
+            )
+            return self.serialize(self.create_response_schema, item, status_code=201)
+
+        return await idempotency.execute(request, session, user, create, 201)
+
+    async def create_items(
+        self,
+        request: Request,
+        items: list[dict],
+        session: AsyncSession = Depends(get_db_session),
+    ):
+        user = await self.get_user(request)
+        if len(items) > Settings.batch_max_size:
+            raise BaseHTTPException(
+                status_code=413,
+                error="batch_too_large",
+                message=f"Batch is limited to {Settings.batch_max_size} items",
+            )
+
+        async def create():
+            items_data = await create_batch_dto(self.schema)(request, user)
+            items = await self.model.create_items(
+                session, [item.model_dump() for item in items_data], commit=False
+            )
+            if not self.fast_serialization:
+                return [self.create_response_schema(**item.__dict__) for item in items]
+            adapter = self.create_items_adapter
+            return Response(
+                adapter.dump_json(adapter.validate_python(items, from_attributes=True)),
+                status_code=201,
+                media_type="application/json",
+            )
+
+        return await idempotency.execute(request, session, user, create, 201)
 
     async def update_item(
         self,
@@ -161,7 +552,9 @@ class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
             )
 
         item = await self.model.update_item(session, item, data)
-        return self.update_response_schema(**item.__dict__)
+        if self.response_cache is not None:
+            await self.response_cache.invalidate(self.model, item)
+        return self.serialize(self.update_response_schema, item)
 
     async def delete_item(
         self,
@@ -181,4 +574,6 @@ class AbstractBaseRouter(Generic[T, TS], metaclass=singleton.Singleton):
             )
 
         item = await self.model.delete_item(session, item)
-        return self.delete_response_schema(**item.__dict__)
+        if self.response_cache is not None:
+            await self.response_cache.invalidate(self.model, item)
+        return self.serialize(self.delete_response_schema, item)
@@ -1,5 +1,8 @@
+import base64
+import json
 import uuid
 from datetime import datetime
+from enum import Enum
 from typing import Any, Generic, TypeVar
 
 from pydantic import BaseModel, Field
@@ -31,8 +34,35 @@ class BusinessOwnedEntitySchema(OwnedEntitySchema, BusinessEntitySchema):
 T = TypeVar("T", bound=BaseEntitySchema)
 
 
+class CountMode(str, Enum):
+    exact = "exact"
+    estimated = "estimated"
+    none = "none"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
 class PaginatedResponse(BaseModel, Generic[T]):
     items: list[T]
-    total: int
+    total: int | None
     offset: int
     limit: int
+    next_cursor: str | None = None
+
+
+def encode_cursor(created_at: datetime, uid: uuid.UUID) -> str:
+    raw = json.dumps([created_at.isoformat(), str(uid)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """Decode an opaque pagination cursor, raising ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, uid = json.loads(raw)
+        return datetime.fromisoformat(created_at), uuid.UUID(uid)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid pagination cursor") from e
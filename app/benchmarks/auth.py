@@ -0,0 +1,163 @@
+"""Authentication overhead per request on the list route.
+
+Runs the same list request through three routers: one whose user
+dependency returns a fixed user, one verifying an Ed25519 JWT on every
+request (what usso does), and the same verifier behind the token cache.
+The difference to the fixed-user router is the auth overhead:
+
+    python -m benchmarks.auth [-n 2000]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+from apps.base.models import Base, OwnedEntity
+from apps.base.routes import AbstractBaseRouter
+from apps.base.schemas import OwnedEntitySchema
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from fastapi import FastAPI
+from server.db import get_read_session
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Mapped, sessionmaker
+
+
+class BenchAuth(OwnedEntity):
+    title: Mapped[str]
+
+
+class BenchAuthSchema(OwnedEntitySchema):
+    title: str
+
+
+class User:
+    def __init__(self, uid: uuid.UUID):
+        self.uid = uid
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+private_key = Ed25519PrivateKey.generate()
+public_key = private_key.public_key()
+user_id = uuid.uuid4()
+
+
+def make_token() -> str:
+    header = b64(json.dumps({"alg": "EdDSA", "typ": "JWT"}).encode())
+    payload = b64(
+        json.dumps({"sub": str(user_id), "exp": int(time.time()) + 3600}).encode()
+    )
+    signature = private_key.sign(f"{header}.{payload}".encode())
+    return f"{header}.{payload}.{b64(signature)}"
+
+
+async def fixed_user(request):
+    return User(user_id)
+
+
+async def verify_user(request):
+    token = request.headers["authorization"].removeprefix("Bearer ")
+    header, payload, signature = token.split(".")
+    public_key.verify(unb64(signature), f"{header}.{payload}".encode())
+    claims = json.loads(unb64(payload))
+    if claims["exp"] <= time.time():
+        raise ValueError("expired")
+    return User(uuid.UUID(claims["sub"]))
+
+
+# The router metaclass is a singleton, so each variant needs its own class
+class FixedRouter(AbstractBaseRouter):
+    pass
+
+
+class VerifyRouter(AbstractBaseRouter):
+    pass
+
+
+class CachedRouter(AbstractBaseRouter):
+    pass
+
+
+async def run(url: str, n: int) -> dict[str, dict]:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[BenchAuth.__table__])
+    async_session = sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    async with async_session() as session:
+        await BenchAuth.create_items(
+            session, [{"title": f"item {i}", "user_id": user_id} for i in range(10)]
+        )
+
+    async def read_session():
+        async with async_session() as session:
+            yield session
+
+    app = FastAPI()
+    app.dependency_overrides[get_read_session] = read_session
+    routers = {
+        "fixed": FixedRouter(
+            BenchAuth,
+            fixed_user,
+            schema=BenchAuthSchema,
+            prefix="/fixed",
+            cache_auth=False,
+        ),
+        "verify": VerifyRouter(
+            BenchAuth,
+            verify_user,
+            schema=BenchAuthSchema,
+            prefix="/verify",
+            cache_auth=False,
+        ),
+        "cached": CachedRouter(
+            BenchAuth, verify_user, schema=BenchAuthSchema, prefix="/cached"
+        ),
+    }
+    for router in routers.values():
+        app.include_router(router.router)
+
+    headers = {"authorization": f"Bearer {make_token()}"}
+    timings = {name: [] for name in routers}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        # Interleave the variants so drift affects them equally
+        for i in range(n + n // 10):
+            for name, samples in timings.items():
+                start = time.perf_counter()
+                response = await c.get(f"/{name}/", headers=headers)
+                if i >= n // 10:  # warm-up
+                    samples.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+    await engine.dispose()
+    baseline = statistics.median(timings["fixed"])
+    return {
+        name: {
+            "p50_us": round(statistics.median(samples) * 1e6, 1),
+            "auth_overhead_us": round((statistics.median(samples) - baseline) * 1e6, 1),
+        }
+        for name, samples in timings.items()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="sqlite+aiosqlite:///:memory:")
+    parser.add_argument("-n", type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, stats in asyncio.run(run(args.url, args.n)).items():
+        print(name, stats)
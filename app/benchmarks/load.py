@@ -0,0 +1,109 @@
+"""Requests per second of serve.py as the worker count grows.
+
+For each worker count the server is started on a free port, loaded by
+several client processes for a fixed duration, then stopped. Run it on a
+machine with spare cores for the clients, against the route to measure:
+
+    python -m benchmarks.load --workers 1,2,4 --duration 10
+    python -m benchmarks.load --workers 1,4 --path /metrics/pool --clients 4
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+app_dir = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+
+async def load(url: str, concurrency: int, duration: float):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async def user(client: httpx.AsyncClient):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(url)
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.TransportError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args: tuple) -> tuple[list[float], int]:
+    return asyncio.run(load(*args))
+
+
+def measure(workers: int, args) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)],
+        cwd=app_dir,
+    )
+    try:
+        url = f"http://127.0.0.1:{port}{args.path}"
+        wait_ready(url)
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(
+                client_process,
+                [(url, args.concurrency, args.duration)] * args.clients,
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = sorted(t for samples, _ in results for t in samples)
+    return {
+        "workers": workers,
+        "rps": round(len(latencies) / args.duration, 1),
+        "errors": sum(errors for _, errors in results),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        print(json.dumps(measure(workers, args)))
@@ -0,0 +1,104 @@
+"""Serialization cost of one 100-row transaction page.
+
+Compares the previous path (schema(**item.__dict__) per row, then FastAPI's
+response_model validation and JSON rendering) with the router's fast path
+(one from_attributes validation for the page, then model_dump_json).
+
+    python -m benchmarks.serialization [-n 2000] [--rows 100]
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from apps.base.models import BaseEntity
+from apps.base.schemas import BaseEntitySchema, PaginatedResponse
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Mapped
+
+
+class BenchTransaction(BaseEntity):
+    wallet_id: Mapped[uuid.UUID]
+    amount: Mapped[Decimal]
+    balance: Mapped[Decimal]
+    description: Mapped[str | None]
+    note: Mapped[str | None]
+    business_id: Mapped[uuid.UUID]
+    owner_id: Mapped[uuid.UUID]
+
+
+class BenchTransactionSchema(BaseEntitySchema):
+    wallet_id: uuid.UUID
+    amount: Decimal
+    balance: Decimal
+    description: str | None = None
+    note: str | None = None
+    business_id: uuid.UUID
+    owner_id: uuid.UUID
+
+
+def make_rows(count: int) -> list[BenchTransaction]:
+    wallet_id, business_id, owner_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    now = datetime.now(timezone.utc)
+    return [
+        BenchTransaction(
+            uid=uuid.uuid4(),
+            created_at=now,
+            updated_at=now,
+            is_deleted=False,
+            meta_data={"invoice": i},
+            wallet_id=wallet_id,
+            amount=Decimal("-12.50"),
+            balance=Decimal(1000 - i),
+            description="usage charge",
+            note=None,
+            business_id=business_id,
+            owner_id=owner_id,
+        )
+        for i in range(count)
+    ]
+
+
+page_schema = PaginatedResponse[BenchTransactionSchema]
+page_adapter = TypeAdapter(page_schema)
+items_adapter = TypeAdapter(list[BenchTransactionSchema])
+
+
+def previous_path(rows) -> bytes:
+    items = [BenchTransactionSchema(**row.__dict__) for row in rows]
+    response = PaginatedResponse(items=items, total=10000, offset=0, limit=len(rows))
+    # What FastAPI does with response_model: dump, validate, serialize, render
+    value = page_adapter.validate_python(response.model_dump())
+    content = page_adapter.dump_python(value, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def fast_path(rows) -> bytes:
+    items = items_adapter.validate_python(rows, from_attributes=True)
+    return page_schema.model_construct(
+        items=items, total=10000, offset=0, limit=len(rows), next_cursor=None
+    ).model_dump_json()
+
+
+def measure(func, rows, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        func(rows)
+    return (time.perf_counter() - start) / n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=100)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    assert json.loads(previous_path(rows)) == json.loads(fast_path(rows))
+    before = measure(previous_path, rows, args.n)
+    after = measure(fast_path, rows, args.n)
+    print(f"previous: {before * 1000:.3f} ms/page")
+    print(f"fast:     {after * 1000:.3f} ms/page ({before / after:.1f}x)")
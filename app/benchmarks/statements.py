@@ -0,0 +1,83 @@
+"""Python overhead per call of get_item, list_items and total_count.
+
+`--rebuild` drops the per-class statement cache before every call, which is
+what the read path used to pay for building its select() each time. An
+in-memory SQLite database keeps the driver round trip small, so the numbers
+are dominated by statement construction and compilation:
+
+    python -m benchmarks.statements
+    python -m benchmarks.statements --rebuild
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from apps.base.models import Base, OwnedEntity, count_cache
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Mapped, sessionmaker
+
+
+class BenchRead(OwnedEntity):
+    title: Mapped[str]
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    samples = sorted(samples)
+    return {
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "p99_us": round(samples[int(len(samples) * 0.99)] * 1e6, 1),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 1),
+    }
+
+
+async def run(url: str, n: int, rebuild: bool) -> dict[str, dict]:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[BenchRead.__table__])
+    async_session = sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+    user_id = uuid.uuid4()
+    async with async_session() as session:
+        items = await BenchRead.create_items(
+            session, [{"title": f"item {i}", "user_id": user_id} for i in range(50)]
+        )
+        uid = items[0].uid
+
+        calls = {
+            "get_item": lambda: BenchRead.get_item(session, uid, user_id=user_id),
+            "list_items": lambda: BenchRead.list_items(
+                session, user_id=user_id, limit=10
+            ),
+            "total_count": lambda: BenchRead.total_count(session, user_id=user_id),
+        }
+        timings = {}
+        for name, call in calls.items():
+            samples = timings[name] = []
+            for _ in range(n):
+                if rebuild:
+                    BenchRead._statements.clear()
+                count_cache.clear()
+                start = time.perf_counter()
+                await call()
+                samples.append(time.perf_counter() - start)
+                session.expunge_all()
+
+    await engine.dispose()
+    return {name: percentiles(samples) for name, samples in timings.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="sqlite+aiosqlite:///:memory:")
+    parser.add_argument("-n", type=int, default=5000)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.n, args.rebuild))
+    for name, stats in results.items():
+        print(name, stats)
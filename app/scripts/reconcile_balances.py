@@ -0,0 +1,63 @@
+"""Rebuild the wallet balance snapshot from the transaction ledger.
+
+Run with `python -m scripts.reconcile_balances [--dry-run]`.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from server.db import engine
+from sqlalchemy import text
+
+# The sum of the amounts, not the latest row's running balance: rows written
+# with equal or skewed timestamps would make "latest" pick a stale balance
+ledger_balance = """
+    COALESCE((
+        SELECT SUM(t.amount) FROM "transaction" t
+        WHERE t.wallet_id = wallet.uid AND t.is_deleted = false
+    ), 0)
+"""
+
+drift_query = text(
+    f"SELECT wallet.uid FROM wallet WHERE wallet.balance <> {ledger_balance}"
+)
+lock_query = text("SELECT balance FROM wallet WHERE uid = :uid FOR UPDATE")
+reconcile_query = text(
+    f"UPDATE wallet SET balance = {ledger_balance} WHERE wallet.uid = :uid "
+    f"RETURNING balance"
+)
+
+
+async def reconcile_wallet_balances(dry_run: bool = False) -> int:
+    """Reset every drifted wallet balance to the sum of its ledger amounts.
+
+    Each wallet is fixed in its own transaction while holding the same row
+    lock as the write path, so concurrent inserts are never overwritten.
+    """
+    async with engine.connect() as conn:
+        drifted = (await conn.execute(drift_query)).scalars().all()
+
+    if dry_run:
+        for uid in drifted:
+            logging.warning(f"Wallet {uid} balance drifted from the ledger")
+        return len(drifted)
+
+    for uid in drifted:
+        async with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                old_balance = (await conn.execute(lock_query, {"uid": uid})).scalar()
+            else:
+                old_balance = None
+            new_balance = (await conn.execute(reconcile_query, {"uid": uid})).scalar()
+            logging.warning(f"Wallet {uid} balance {old_balance} -> {new_balance}")
+    return len(drifted)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    count = asyncio.run(reconcile_wallet_balances(dry_run=args.dry_run))
+    print(f"{count} wallet balances {'drifted' if args.dry_run else 'reconciled'}")
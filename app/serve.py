@@ -0,0 +1,59 @@
+"""Production entry point: `python serve.py [--workers N] [--port P]`.
+
+Runs one uvicorn worker per available core, with uvloop and httptools when
+they are installed, and without the per-request access log. `app.py` stays
+the development entry point with reload.
+"""
+
+import argparse
+import importlib.util
+import os
+
+import uvicorn
+from server.config import Settings
+
+
+def available_cpus() -> int:
+    """Cores this process may use, honouring affinity and a cgroup v2 quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default=Settings.web_host)
+    parser.add_argument("--port", type=int, default=Settings.web_port)
+    parser.add_argument("--workers", type=int, default=Settings.web_workers)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        "app:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers or available_cpus(),
+        loop="uvloop" if installed("uvloop") else "asyncio",
+        http="httptools" if installed("httptools") else "h11",
+        backlog=Settings.web_backlog,
+        timeout_keep_alive=Settings.web_keep_alive,
+        access_log=False,
+        proxy_headers=True,
+        server_header=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
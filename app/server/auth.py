@@ -0,0 +1,131 @@
+"""Caching around token verification.
+
+A verified user is cached under the hash of the credential the dependency
+verifies, found through usso's own header and cookie lookup, until
+the token's `exp`, capped at `auth_cache_ttl` so revocations still apply
+within that bound. Only successful verifications are cached, and the key
+covers the whole token including its signature.
+"""
+
+import base64
+import hashlib
+import inspect
+import json
+import time
+
+from fastapi import Request
+from server.config import Settings
+from server.periodic import PeriodicTask
+from usso.config import APIHeaderConfig, HeaderConfig
+from utils.cache import TTLCache
+
+# (dependency, credential hash) -> user
+users = TTLCache(maxsize=Settings.auth_cache_size, ttl=Settings.auth_cache_ttl)
+
+
+# usso's default token locations, for dependencies that do not expose theirs
+default_headers = (HeaderConfig(), APIHeaderConfig())
+
+
+def request_credential(dependency, request: Request) -> str | None:
+    """The token `dependency` verifies, extracted the way usso extracts it."""
+    if hasattr(dependency, "get_request_jwt"):
+        credential = dependency.get_request_jwt(request)
+        return credential or dependency.get_request_api_key(request)
+    for header in default_headers:
+        credential = header.get_key(request)
+        if credential:
+            return credential
+    return None
+
+
+def token_expiry(credential: str) -> float | None:
+    """`exp` claim of an already verified JWT, read without verifying."""
+    token = credential.removeprefix("Bearer ").strip()
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+async def call_dependency(dependency, request: Request):
+    user = dependency(request)
+    if inspect.isawaitable(user):
+        user = await user
+    return user
+
+
+async def cached_user(dependency, request: Request):
+    credential = request_credential(dependency, request)
+    if not credential:
+        return await call_dependency(dependency, request)
+
+    key = (dependency, hashlib.blake2b(credential.encode(), digest_size=16).digest())
+    user = users.get(key)
+    if user is not None:
+        return user
+
+    user = await call_dependency(dependency, request)
+    if user is None:
+        return None
+    ttl = Settings.auth_cache_ttl
+    expiry = token_expiry(credential)
+    if expiry is not None:
+        ttl = min(ttl, expiry - time.time())
+    if ttl > 0:
+        users.set(key, user, ttl)
+    return user
+
+
+class JWKSRefresher(PeriodicTask):
+    """Keeps usso's JWK cache filled from a background task.
+
+    usso fetches a missing key synchronously inside the request, blocking
+    the event loop; refreshing well within its cache TTL avoids that.
+    """
+
+    description = "JWKS refresh"
+
+    def __init__(
+        self,
+        url: str = Settings.jwks_url,
+        interval: float = Settings.jwks_refresh_interval,
+    ):
+        super().__init__(interval)
+        self.url = url
+        self.refreshes_total = 0
+
+    async def refresh(self) -> int:
+        # Imported here, so startup only pays for them when JWKS is configured
+        import httpx
+
+        try:
+            from usso_jwt.verify import fetch_jwk
+        except ImportError:  # usso versions without usso_jwt fetch keys themselves
+            fetch_jwk = None
+
+        async with httpx.AsyncClient(timeout=10) as client:
+            response = await client.get(self.url)
+            response.raise_for_status()
+        keys = response.json()["keys"]
+        if fetch_jwk is not None:
+            for key in keys:
+                cache_key = fetch_jwk.cache_key(jwks_url=self.url, kid=key["kid"])
+                fetch_jwk.cache[cache_key] = key
+        self.refreshes_total += 1
+        return len(keys)
+
+    async def tick(self):
+        await self.refresh()
+
+    def metrics(self) -> list[str]:
+        return [
+            "# TYPE auth_cache_entries gauge",
+            f"auth_cache_entries {len(users)}",
+            "# TYPE jwks_refreshes_total counter",
+            f"jwks_refreshes_total {self.refreshes_total}",
+            "# TYPE jwks_refresh_errors_total counter",
+            f"jwks_refresh_errors_total {self.errors_total}",
+        ]
@@ -7,6 +7,7 @@ import os
 from pathlib import Path
 
 import dotenv
+from server import log
 from singleton import Singleton
 
 dotenv.load_dotenv()
@@ -30,22 +31,104 @@ class Settings(metaclass=Singleton):
     DATABASE_URL_SYNC: str = os.getenv(
         "DATABASE_URL_SYNC", default="sqlite:///./test.db"
     )
+    # Optional read replica for list/retrieve endpoints
+    DATABASE_REPLICA_URL: str | None = os.getenv("DATABASE_REPLICA_URL")
+
+    # create_all (development), check_head (migrated deployments) or none
+    db_startup: str = os.getenv("DB_STARTUP", default="create_all")
+    db_echo: bool = os.getenv("DB_ECHO", default="0") in ("1", "true")
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", default=10))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", default=10))
+    db_pool_timeout: float = float(os.getenv("DB_POOL_TIMEOUT", default=10))
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", default=1800))
+    db_pool_pre_ping: bool = os.getenv("DB_POOL_PRE_PING", default="1") in ("1", "true")
+    # Reads stay on the primary this long after the same client wrote
+    replica_sticky_seconds: float = float(
+        os.getenv("REPLICA_STICKY_SECONDS", default=5)
+    )
+
+    hold_expiry_enabled: bool = os.getenv("HOLD_EXPIRY_ENABLED", default="1") in (
+        "1",
+        "true",
+    )
+    hold_expiry_interval: float = float(os.getenv("HOLD_EXPIRY_INTERVAL", default=5))
+    hold_expiry_batch_size: int = int(os.getenv("HOLD_EXPIRY_BATCH_SIZE", default=1000))
+
+    idempotency_ttl: float = float(os.getenv("IDEMPOTENCY_TTL", default=24 * 3600))
+    # Expired records are deleted in batches this often
+    idempotency_purge_interval: float = float(
+        os.getenv("IDEMPOTENCY_PURGE_INTERVAL", default=300)
+    )
+    idempotency_purge_batch_size: int = int(
+        os.getenv("IDEMPOTENCY_PURGE_BATCH_SIZE", default=1000)
+    )
+    idempotency_cache_size: int = int(
+        os.getenv("IDEMPOTENCY_CACHE_SIZE", default=10000)
+    )
+    # Replay bodies held in process; larger bodies are replayed from the table
+    idempotency_cache_bytes: int = int(
+        os.getenv("IDEMPOTENCY_CACHE_BYTES", default=64 * 2**20)
+    )
+    idempotency_cache_max_body: int = int(
+        os.getenv("IDEMPOTENCY_CACHE_MAX_BODY", default=256 * 2**10)
+    )
+
+    permission_refresh_interval: float = float(
+        os.getenv("PERMISSION_REFRESH_INTERVAL", default=5)
+    )
+
+    # Verified users are reused until the token expires, at most this long
+    auth_cache_ttl: float = float(os.getenv("AUTH_CACHE_TTL", default=60))
+    auth_cache_size: int = int(os.getenv("AUTH_CACHE_SIZE", default=100000))
+    # JWKS kept warm in the background, so key fetches stay off requests
+    jwks_url: str | None = os.getenv("USSO_JWKS_URL")
+    jwks_refresh_interval: float = float(
+        os.getenv("JWKS_REFRESH_INTERVAL", default=600)
+    )
 
     testing: bool = os.getenv("TESTING", default=False)
 
+    page_max_limit: int = int(os.getenv("PAGE_MAX_LIMIT", default=100))
+    count_cache_ttl: float = float(os.getenv("COUNT_CACHE_TTL", default=30))
+    count_cache_size: int = int(os.getenv("COUNT_CACHE_SIZE", default=10000))
+    batch_max_size: int = int(os.getenv("BATCH_MAX_SIZE", default=10000))
+    response_cache_ttl: float = float(os.getenv("RESPONSE_CACHE_TTL", default=60))
+    response_cache_size: int = int(os.getenv("RESPONSE_CACHE_SIZE", default=10000))
+    # Rows fetched from the export cursor and written per response chunk
+    export_batch_size: int = int(os.getenv("EXPORT_BATCH_SIZE", default=1000))
+
+    # Production launcher (serve.py); 0 workers means one per available core
+    web_host: str = os.getenv("WEB_HOST", default="0.0.0.0")
+    web_port: int = int(os.getenv("WEB_PORT", default=8000))
+    web_workers: int = int(os.getenv("WEB_WORKERS", default=0))
+    web_backlog: int = int(os.getenv("WEB_BACKLOG", default=4096))
+    web_keep_alive: int = int(os.getenv("WEB_KEEP_ALIVE", default=15))
+
+    # Handlers run on a listener thread; the loop only enqueues records
+    log_queue: bool = os.getenv("LOG_QUEUE", default="1") in ("1", "true")
+    log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", default=10000))
+    log_batch_size: int = int(os.getenv("LOG_BATCH_SIZE", default=512))
+    log_flush_interval: float = float(os.getenv("LOG_FLUSH_INTERVAL", default=0.5))
+    log_json: bool = os.getenv("LOG_JSON", default="1") in ("1", "true")
+    # Full tracebacks logged per exception site and window, the rest summarized
+    traceback_limit: int = int(os.getenv("TRACEBACK_LIMIT", default=5))
+    traceback_window: float = float(os.getenv("TRACEBACK_WINDOW", default=60))
+
     log_config = {
         "version": 1,
         "handlers": {
             "console": {
                 "class": "logging.StreamHandler",
                 "level": "WARNING",
-                "formatter": "standard",
+                "formatter": "json" if log_json else "standard",
             },
             "file": {
-                "class": "logging.FileHandler",
+                "class": "server.log.BatchFileHandler"
+                if log_queue
+                else "logging.FileHandler",
                 "level": "INFO",
                 "filename": base_dir / "logs" / f"{project_name}.log",
-                "formatter": "standard",
+                "formatter": "json" if log_json else "standard",
             },
         },
         "formatters": {
@@ -53,7 +136,8 @@ class Settings(metaclass=Singleton):
                 "format": "[{levelname} : {filename}:{lineno} : {asctime} -> {funcName:10}] {message}",
                 # "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
                 "style": "{",
-            }
+            },
+            "json": {"()": "server.log.JSONFormatter"},
         },
         "loggers": {
             "": {
@@ -72,3 +156,7 @@ class Settings(metaclass=Singleton):
             (base_dir / "logs").mkdir()
 
         logging.config.dictConfig(self.log_config)
+        if self.log_queue:
+            log.start_queue(
+                self.log_queue_size, self.log_batch_size, self.log_flush_interval
+            )
@@ -1,25 +1,275 @@
+import asyncio
+import fcntl
+import hashlib
+import math
+import re
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import Request
 from server.config import Settings
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
-engine = create_async_engine(Settings.DATABASE_URL, future=True, echo=True)
+
+def engine_options(url: str) -> dict:
+    options = {
+        "future": True,
+        "echo": Settings.db_echo,
+        "pool_pre_ping": Settings.db_pool_pre_ping,
+        "pool_recycle": Settings.db_pool_recycle,
+    }
+    if ":memory:" not in url:
+        # In-memory SQLite uses a static pool without sizing
+        options.update(
+            pool_size=Settings.db_pool_size,
+            max_overflow=Settings.db_max_overflow,
+            pool_timeout=Settings.db_pool_timeout,
+        )
+    return options
+
+
+engine = create_async_engine(
+    Settings.DATABASE_URL, **engine_options(Settings.DATABASE_URL)
+)
 async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
-from apps.accounting import models as accounting_models
-from apps.applications import models as applications_models
+if Settings.DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(
+        Settings.DATABASE_REPLICA_URL, **engine_options(Settings.DATABASE_REPLICA_URL)
+    )
+else:
+    replica_engine = engine
+async_read_session = sessionmaker(
+    bind=replica_engine, class_=AsyncSession, expire_on_commit=False
+)
 
 # Base = declarative_base()  # model base class
 from apps.base.models import Base
-from apps.business import models as business_models
 
-__all__ = ["accounting_models", "applications_models", "business_models"]
 
+def load_models():
+    """Import every app's models, so Base.metadata holds the whole schema.
+
+    Only create_all and Alembic need that; routers import their own models.
+    """
+    from apps.accounting import models as accounting_models  # noqa: F401
+    from apps.applications import models as applications_models  # noqa: F401
+    from apps.business import models as business_models  # noqa: F401
+
+
+class PoolStats:
+    """Checkout wait times measured when a request session takes a connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waiting = 0
+        self.timeouts = 0
+
+    def report(self, pool) -> dict:
+        return {
+            "size": pool.size(),
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": self.wait_total,
+            "wait_seconds_max": self.wait_max,
+        }
+
+    async def connect(self, session: AsyncSession):
+        # Take the connection up front so pool waits are measured per request
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await session.connection()
+        except TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+        wait = time.perf_counter() - start
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+
+pool_stats = PoolStats()
+replica_pool_stats = PoolStats() if replica_engine is not engine else pool_stats
+
+# Clients that wrote recently keep reading from the primary (read-your-writes).
+# The deadline travels in a cookie, so it holds whichever worker serves the read.
+sticky_cookie = "read_primary_until"
+write_methods = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+def pool_status() -> dict:
+    status = pool_stats.report(engine.sync_engine.pool)
+    if replica_engine is not engine:
+        status["replica"] = replica_pool_stats.report(replica_engine.sync_engine.pool)
+    return status
+
+
+def use_primary(request: Request) -> bool:
+    if replica_engine is engine:
+        return True
+    if request.headers.get("x-read-consistency", "").lower() == "primary":
+        return True
+    try:
+        return float(request.cookies.get(sticky_cookie, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class StickyPrimaryMiddleware:
+    """Pure ASGI middleware marking clients that just wrote.
+
+    Responses to writes set a cookie holding the time until which the
+    client's reads stay on the primary. Clients that drop cookies can send
+    `X-Read-Consistency: primary` instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in write_methods:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 500:
+                seconds = Settings.replica_sticky_seconds
+                cookie = (
+                    f"{sticky_cookie}={time.time() + seconds:.3f}; "
+                    f"Max-Age={math.ceil(seconds)}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"set-cookie", cookie.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
 
-async def get_session():
+        await self.app(scope, receive, send_wrapper)
+
+
+async def get_db_session():
     async with async_session() as session:
+        await pool_stats.connect(session)
         yield session
 
 
+async def get_read_session(request: Request = None):
+    """Session for read-only endpoints, served by the replica when configured.
+
+    Requests with `X-Read-Consistency: primary`, or carrying the cookie set
+    by a write within the last `replica_sticky_seconds`, stay on the primary.
+    """
+    if request is None or use_primary(request):
+        factory, stats = async_session, pool_stats
+    else:
+        factory, stats = async_read_session, replica_pool_stats
+
+    async with factory() as session:
+        await stats.connect(session)
+        yield session
+
+
+get_session = get_db_session
+# For endpoints that may answer without touching the database
+read_session = asynccontextmanager(get_read_session)
+
+
+# Advisory lock id shared by all workers of this project
+startup_lock_key = int.from_bytes(
+    hashlib.blake2b(Settings.project_name.encode(), digest_size=7).digest(), "big"
+)
+
+
+@asynccontextmanager
+async def startup_lock():
+    """Runs startup work in one worker process at a time.
+
+    Postgres uses a session advisory lock, other databases a lock file under
+    logs/, so workers started together do not race on DDL.
+    """
+    if engine.dialect.name == "postgresql":
+        params = {"key": startup_lock_key}
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT pg_advisory_lock(:key)"), params)
+            try:
+                yield
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), params)
+    else:
+        path = Settings.base_dir / "logs" / "startup.lock"
+        path.parent.mkdir(exist_ok=True)
+        with open(path, "w") as lock_file:
+            await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def alembic_head() -> str:
+    """Head revision of alembic/versions, read without importing Alembic.
+
+    Importing Alembic costs more than the whole check, so the revision
+    identifiers are parsed from the migration files directly.
+    """
+    revisions, parents = set(), set()
+    for path in (Settings.base_dir / "alembic" / "versions").glob("*.py"):
+        source = path.read_text()
+        revision = re.search(r'^revision\b[^=]*=\s*"(\w+)"', source, re.M)
+        down_revision = re.search(r"^down_revision\b[^=]*=(.*)$", source, re.M)
+        if revision:
+            revisions.add(revision[1])
+        if down_revision:
+            parents.update(re.findall(r'"(\w+)"', down_revision[1]))
+    heads = revisions - parents
+    if len(heads) != 1:
+        raise RuntimeError(f"Expected one Alembic head, found {sorted(heads)}")
+    return heads.pop()
+
+
+async def check_revision():
+    """Fail startup unless the database is migrated to the code's head."""
+    head = alembic_head()
+    async with engine.connect() as conn:
+        try:
+            current = (
+                await conn.execute(text("SELECT version_num FROM alembic_version"))
+            ).scalar()
+        except DBAPIError:
+            current = None
+    if current != head:
+        raise RuntimeError(
+            f"Database is at revision {current}, code expects {head}; "
+            f"run `alembic upgrade head`"
+        )
+
+
 async def init_db():
+    """Prepare the schema according to `Settings.db_startup`.
+
+    `create_all` creates missing tables from the models, `check_head` only
+    compares the Alembic revision, and `none` skips both.
+    """
+    if Settings.db_startup == "check_head":
+        return await check_revision()
+    if Settings.db_startup != "create_all":
+        return
+
+    load_models()
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+    if replica_engine is not engine and replica_engine.dialect.name == "sqlite":
+        # Local replica files are not replicated, so create their tables too
+        async with replica_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
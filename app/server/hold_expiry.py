@@ -0,0 +1,111 @@
+"""Background release of expired wallet holds.
+
+Each sweep claims a bounded batch of overdue holds through the
+(status, expires_at) index. On Postgres the batch is claimed with
+FOR UPDATE SKIP LOCKED, so every worker process can run a sweeper without
+waiting on the others.
+"""
+
+import time
+from datetime import datetime, timezone
+
+from server.config import Settings
+from server.periodic import PeriodicTask
+from sqlalchemy import DateTime, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+ACTIVE = "active"
+EXPIRED = "expired"
+
+release_query = """
+    UPDATE wallethold SET status = :expired, updated_at = :now
+    WHERE uid IN (
+        SELECT uid FROM wallethold
+        WHERE status = :active AND expires_at <= :now
+        ORDER BY expires_at
+        LIMIT :batch_size
+        {lock}
+    )
+    RETURNING expires_at
+"""
+
+
+class HoldExpiryScheduler(PeriodicTask):
+    description = "Hold expiry sweep"
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        interval: float = Settings.hold_expiry_interval,
+        batch_size: int = Settings.hold_expiry_batch_size,
+    ):
+        super().__init__(interval)
+        self.engine = engine
+        self.batch_size = batch_size
+        lock = "FOR UPDATE SKIP LOCKED" if engine.dialect.name == "postgresql" else ""
+        self.query = text(release_query.format(lock=lock)).columns(
+            expires_at=DateTime
+        )
+
+        self.released_total = 0
+        self.sweeps_total = 0
+        self.lag_seconds = 0.0
+        self.last_sweep_seconds = 0.0
+
+    async def release_batch(self, now: datetime) -> list[datetime]:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                self.query,
+                {
+                    "active": ACTIVE,
+                    "expired": EXPIRED,
+                    "now": now,
+                    "batch_size": self.batch_size,
+                },
+            )
+            return result.scalars().all()
+
+    async def sweep(self) -> int:
+        """Release overdue holds batch by batch until none are left."""
+        start = time.perf_counter()
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        released, lag = 0, 0.0
+        while True:
+            expires = await self.release_batch(now)
+            if expires:
+                lag = max(lag, (now - min(expires)).total_seconds())
+            released += len(expires)
+            if len(expires) < self.batch_size:
+                break
+
+        self.sweeps_total += 1
+        self.released_total += released
+        self.lag_seconds = lag
+        self.last_sweep_seconds = time.perf_counter() - start
+        return released
+
+    async def tick(self):
+        await self.sweep()
+
+    def status(self) -> dict:
+        return {
+            "released_total": self.released_total,
+            "sweeps_total": self.sweeps_total,
+            "errors_total": self.errors_total,
+            "lag_seconds": self.lag_seconds,
+            "last_sweep_seconds": self.last_sweep_seconds,
+        }
+
+    def metrics(self) -> list[str]:
+        return [
+            "# TYPE hold_expiry_released_total counter",
+            f"hold_expiry_released_total {self.released_total}",
+            "# TYPE hold_expiry_sweeps_total counter",
+            f"hold_expiry_sweeps_total {self.sweeps_total}",
+            "# TYPE hold_expiry_errors_total counter",
+            f"hold_expiry_errors_total {self.errors_total}",
+            "# TYPE hold_expiry_lag_seconds gauge",
+            f"hold_expiry_lag_seconds {self.lag_seconds}",
+            "# TYPE hold_expiry_last_sweep_seconds gauge",
+            f"hold_expiry_last_sweep_seconds {self.last_sweep_seconds}",
+        ]
@@ -0,0 +1,84 @@
+"""Background deletion of expired idempotency records.
+
+Records are only needed for `idempotency_ttl` seconds. Each purge deletes
+them in bounded batches through the created_at index, so the table stays
+proportional to one TTL of traffic and no batch holds locks for long.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+from server.config import Settings
+from server.periodic import PeriodicTask
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+purge_query = text(
+    """
+    DELETE FROM idempotencyrecord
+    WHERE uid IN (
+        SELECT uid FROM idempotencyrecord
+        WHERE created_at < :cutoff
+        LIMIT :batch_size
+    )
+    """
+)
+
+
+class IdempotencyPurger(PeriodicTask):
+    description = "Idempotency record purge"
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        interval: float = Settings.idempotency_purge_interval,
+        batch_size: int = Settings.idempotency_purge_batch_size,
+        ttl: float = Settings.idempotency_ttl,
+    ):
+        super().__init__(interval)
+        self.engine = engine
+        self.batch_size = batch_size
+        self.ttl = ttl
+
+        self.purged_total = 0
+        self.purges_total = 0
+        self.last_purge_seconds = 0.0
+
+    async def purge_batch(self, cutoff: datetime) -> int:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                purge_query, {"cutoff": cutoff, "batch_size": self.batch_size}
+            )
+            return result.rowcount
+
+    async def purge(self) -> int:
+        """Delete expired records batch by batch until none are left."""
+        start = time.perf_counter()
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        cutoff = now - timedelta(seconds=self.ttl)
+        purged = 0
+        while True:
+            deleted = await self.purge_batch(cutoff)
+            purged += deleted
+            if deleted < self.batch_size:
+                break
+
+        self.purges_total += 1
+        self.purged_total += purged
+        self.last_purge_seconds = time.perf_counter() - start
+        return purged
+
+    async def tick(self):
+        await self.purge()
+
+    def metrics(self) -> list[str]:
+        return [
+            "# TYPE idempotency_purged_total counter",
+            f"idempotency_purged_total {self.purged_total}",
+            "# TYPE idempotency_purges_total counter",
+            f"idempotency_purges_total {self.purges_total}",
+            "# TYPE idempotency_purge_errors_total counter",
+            f"idempotency_purge_errors_total {self.errors_total}",
+            "# TYPE idempotency_last_purge_seconds gauge",
+            f"idempotency_last_purge_seconds {self.last_purge_seconds}",
+        ]
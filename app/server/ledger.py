@@ -0,0 +1,129 @@
+"""Ledger writes that keep the wallet balance snapshot current.
+
+Every transaction row moves its wallet's balance in the same database
+transaction as its insert: one `UPDATE wallet ... RETURNING balance` per
+wallet, in uid order, takes the row lock and yields the new balance, and
+the rows are then written with their running balances. Settlement moves
+its wallets through the same functions. The caller owns the transaction,
+so the balance and the rows commit or roll back together.
+
+Once that transaction commits, `balance_listeners` are awaited with the
+uids of the wallets that moved, so caches of wallet rows can drop them.
+"""
+
+import asyncio
+import uuid
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from core.exceptions import BaseHTTPException
+from sqlalchemy import Numeric, Row, Uuid, bindparam, event, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+wallet_table = "wallet"
+# Awaited with the uids of wallets whose balance moved, after the commit
+balance_listeners: list[Callable[[set[uuid.UUID]], Awaitable[None]]] = []
+# Notifications started from session commits, referenced until they finish
+notifying: set[asyncio.Task] = set()
+
+balance_query = (
+    text(
+        """
+        UPDATE wallet SET balance = balance + :delta, updated_at = :now
+        WHERE uid = :uid AND is_deleted = false
+        RETURNING balance, currency, business_id, owner_id
+        """
+    )
+    .bindparams(bindparam("uid", type_=Uuid), bindparam("delta", type_=Numeric))
+    .columns(balance=Numeric, business_id=Uuid, owner_id=Uuid)
+)
+
+
+async def balances_moved(wallet_ids: set[uuid.UUID]):
+    for listener in balance_listeners:
+        await listener(wallet_ids)
+
+
+def notify_on_commit(session: AsyncSession, wallet_ids: set[uuid.UUID]):
+    def notify(_):
+        task = asyncio.get_running_loop().create_task(balances_moved(wallet_ids))
+        notifying.add(task)
+        task.add_done_callback(notifying.discard)
+
+    event.listen(session.sync_session, "after_commit", notify, once=True)
+
+
+async def move_balances(
+    conn: AsyncSession | AsyncConnection, deltas: dict[uuid.UUID, Decimal]
+) -> dict[uuid.UUID, Row]:
+    """Apply each wallet's delta and return the updated wallet rows.
+
+    Wallets are locked in uid order, so concurrent writers cannot deadlock,
+    and a debit may not leave a balance below zero. On a session, listeners
+    are notified when it commits; connection callers call balances_moved.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    wallets = {}
+    for wallet_id in sorted(deltas):
+        wallet = (
+            await conn.execute(
+                balance_query,
+                {"uid": wallet_id, "delta": deltas[wallet_id], "now": now},
+            )
+        ).one_or_none()
+        if wallet is None:
+            raise BaseHTTPException(
+                status_code=400,
+                error="wallet_not_found",
+                message=f"Wallet {wallet_id} does not exist",
+            )
+        if deltas[wallet_id] < 0 and wallet.balance < 0:
+            raise BaseHTTPException(
+                status_code=402,
+                error="insufficient_funds",
+                message=f"Wallet {wallet_id} has insufficient funds",
+            )
+        wallets[wallet_id] = wallet
+    if balance_listeners and isinstance(conn, AsyncSession):
+        notify_on_commit(conn, set(wallets))
+    return wallets
+
+
+def stamp(rows: list[dict], wallets: dict[uuid.UUID, Row]) -> list[dict]:
+    """Fill in the running balances and timestamps of rows just moved.
+
+    created_at is taken with every wallet lock held, one microsecond apart,
+    so created_at order per wallet matches the running balances.
+    """
+    balances = {wallet_id: wallet.balance for wallet_id, wallet in wallets.items()}
+    for row in rows:
+        balances[row["wallet_id"]] -= row["amount"]
+
+    posted_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    for index, row in enumerate(rows):
+        balances[row["wallet_id"]] += row["amount"]
+        row["balance"] = balances[row["wallet_id"]]
+        row["created_at"] = row["updated_at"] = posted_at + timedelta(
+            microseconds=index
+        )
+    return rows
+
+
+async def post(session: AsyncSession, rows: list[dict]) -> list[dict]:
+    """Move the wallets of new ledger rows and fill in the rows' balances.
+
+    `rows` need wallet_id and amount.
+    """
+    deltas = defaultdict(Decimal)
+    for row in rows:
+        row["wallet_id"] = uuid.UUID(str(row["wallet_id"]))
+        row["amount"] = Decimal(str(row["amount"]))
+        deltas[row["wallet_id"]] += row["amount"]
+    return stamp(rows, await move_balances(session, deltas))
+
+
+async def reverse(session: AsyncSession, wallet_id: uuid.UUID, amount: Decimal):
+    """Take a soft-deleted row's amount back out of its wallet's balance."""
+    await move_balances(session, {wallet_id: -Decimal(str(amount))})
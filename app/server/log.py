@@ -0,0 +1,176 @@
+"""Queue-based logging that keeps formatting and disk writes off the loop.
+
+The event loop thread only enqueues records. A listener thread drains the
+queue in batches, formats them, tracebacks included, and flushes each
+handler once per batch. When the queue is full, records are dropped and
+counted rather than blocking the caller.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "file": record.filename,
+            "line": record.lineno,
+            "func": record.funcName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BatchFileHandler(logging.FileHandler):
+    """FileHandler that leaves flushing to the listener, once per batch."""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class LoopQueueHandler(logging.handlers.QueueHandler):
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the arguments here; the listener formats the rest
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LoopQueueHandler.dropped += 1
+
+
+class BatchListener:
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        handlers: list[logging.Handler],
+        batch_size: int = 512,
+        flush_interval: float = 0.5,
+    ):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.thread: threading.Thread | None = None
+        self.stopping = threading.Event()
+
+    def handle(self, batch: list[logging.LogRecord]):
+        for record in batch:
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        for handler in self.handlers:
+            getattr(handler, "flush_batch", handler.flush)()
+
+    def run(self):
+        while not (self.stopping.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.handle(batch)
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name="log-listener", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        for handler in self.handlers:
+            handler.close()
+
+
+listener: BatchListener | None = None
+
+
+def start_queue(size: int, batch_size: int, flush_interval: float):
+    """Move the root logger's configured handlers behind a queue."""
+    global listener
+    stop_queue()
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    log_queue = queue.Queue(maxsize=size)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(LoopQueueHandler(log_queue))
+    listener = BatchListener(log_queue, handlers, batch_size, flush_interval)
+    listener.start()
+
+
+def stop_queue():
+    global listener
+    if listener is None:
+        return
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, LoopQueueHandler):
+            root.removeHandler(handler)
+    listener.stop()
+    listener = None
+
+
+def metrics() -> list[str]:
+    return [
+        "# TYPE log_records_dropped_total counter",
+        f"log_records_dropped_total {LoopQueueHandler.dropped}",
+    ]
+
+
+class TracebackLimiter:
+    """Allows `limit` full tracebacks per exception site every `window` seconds."""
+
+    def __init__(self, limit: int = 5, window: float = 60):
+        self.limit = limit
+        self.window = window
+        # (type, file, line) -> [window start, logged, suppressed]
+        self.sites: dict[tuple, list] = {}
+
+    def allow(self, exc: BaseException) -> tuple[bool, int]:
+        """Whether to log the traceback, and how many were suppressed before."""
+        frames = traceback.extract_tb(exc.__traceback__, limit=-1)
+        frame = frames[-1] if frames else None
+        key = (type(exc), frame and frame.filename, frame and frame.lineno)
+
+        now = time.monotonic()
+        site = self.sites.get(key)
+        if site is None or now - site[0] >= self.window:
+            suppressed = site[2] if site else 0
+            self.sites[key] = [now, 1, 0]
+            if len(self.sites) > 10000:
+                self.sites.clear()
+            return True, suppressed
+        if site[1] < self.limit:
+            site[1] += 1
+            return True, 0
+        site[2] += 1
+        return False, 0
@@ -0,0 +1,221 @@
+"""Low-overhead request and database instrumentation exposed on `/metrics`.
+
+Per-route series are allocated once, the first time a route is seen, and
+the label strings are rendered at that point, so recording a request only
+touches preallocated counters.
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKET_LABELS = tuple(str(b) for b in BUCKETS) + ("+Inf",)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for le, count in zip(BUCKET_LABELS, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RouteMetrics:
+    __slots__ = (
+        "labels",
+        "latency",
+        "db_time",
+        "serialization_time",
+        "requests",
+        "errors",
+        "db_statements",
+    )
+
+    def __init__(self, method: str, route: str):
+        self.labels = f'method="{method}",route="{route}"'
+        self.latency = Histogram()
+        self.db_time = Histogram()
+        self.serialization_time = Histogram()
+        self.requests = 0
+        self.errors = 0
+        self.db_statements = 0
+
+
+class RequestStats:
+    __slots__ = ("db_statements", "db_time", "db_start", "serialization_time")
+
+    def __init__(self):
+        self.db_statements = 0
+        self.db_time = 0.0
+        self.db_start = 0.0
+        self.serialization_time = 0.0
+
+
+routes: dict[tuple[str, str], RouteMetrics] = {}
+# Extra exposition lines from background components, e.g. the hold sweeper
+collectors: list[Callable[[], list[str]]] = []
+unmatched = RouteMetrics("", "unmatched")
+in_flight = 0
+current_request: ContextVar[RequestStats | None] = ContextVar(
+    "current_request", default=None
+)
+# Seconds this worker spent in each startup phase
+startup: dict[str, float] = {}
+
+
+@contextmanager
+def startup_phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup[name] = time.perf_counter() - start
+
+
+def record_serialization(duration: float):
+    stats = current_request.get()
+    if stats is not None:
+        stats.serialization_time += duration
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_statements += 1
+        stats.db_time += time.perf_counter() - stats.db_start
+
+
+def instrument_engine(engine: AsyncEngine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency and DB usage."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        global in_flight
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            in_flight -= 1
+            current_request.reset(token)
+
+            route = scope.get("route")
+            if route is None:
+                metrics = unmatched
+            else:
+                key = (scope["method"], route.path)
+                metrics = routes.get(key)
+                if metrics is None:
+                    metrics = routes[key] = RouteMetrics(*key)
+
+            metrics.requests += 1
+            if status >= 500:
+                metrics.errors += 1
+            metrics.latency.observe(duration)
+            metrics.db_statements += stats.db_statements
+            metrics.db_time.observe(stats.db_time)
+            metrics.serialization_time.observe(stats.serialization_time)
+
+
+def render(pool: dict | None = None) -> str:
+    """Render all series in the Prometheus text exposition format."""
+    seen = [m for m in (*routes.values(), unmatched) if m.requests]
+    lines = [
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {in_flight}",
+    ]
+
+    for name, attr in (
+        ("http_requests_total", "requests"),
+        ("http_request_errors_total", "errors"),
+        ("http_request_db_statements_total", "db_statements"),
+    ):
+        lines.append(f"# TYPE {name} counter")
+        for metrics in seen:
+            lines.append(f"{name}{{{metrics.labels}}} {getattr(metrics, attr)}")
+
+    for name, attr in (
+        ("http_request_duration_seconds", "latency"),
+        ("http_request_db_duration_seconds", "db_time"),
+        ("http_request_serialization_duration_seconds", "serialization_time"),
+    ):
+        lines.append(f"# TYPE {name} histogram")
+        for metrics in seen:
+            lines += getattr(metrics, attr).render(name, metrics.labels)
+
+    pools = {}
+    if pool:
+        pools["primary"] = pool
+        if "replica" in pool:
+            pools["replica"] = pool["replica"]
+    for key in ("size", "in_use", "idle", "overflow", "waiting"):
+        lines.append(f"# TYPE db_pool_{key} gauge")
+        for name, stats in pools.items():
+            lines.append(f'db_pool_{key}{{pool="{name}"}} {stats[key]}')
+    for key, metric in (
+        ("checkouts", "db_pool_checkouts_total"),
+        ("timeouts", "db_pool_timeouts_total"),
+        ("wait_seconds_total", "db_pool_wait_seconds_total"),
+    ):
+        lines.append(f"# TYPE {metric} counter")
+        for name, stats in pools.items():
+            lines.append(f'{metric}{{pool="{name}"}} {stats[key]}')
+
+    if startup:
+        lines.append("# TYPE startup_phase_seconds gauge")
+        for phase, seconds in startup.items():
+            lines.append(f'startup_phase_seconds{{phase="{phase}"}} {seconds}')
+
+    for collector in collectors:
+        lines += collector()
+
+    return "\n".join(lines) + "\n"
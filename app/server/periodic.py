@@ -0,0 +1,49 @@
+"""Base class of the background services that repeat a step on an interval."""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+
+
+class PeriodicTask(ABC):
+    """Runs `tick` every `interval` seconds in a background task.
+
+    A failing tick is logged and counted in `errors_total`, and the next one
+    still runs. `stop` cancels the task and waits for it to finish.
+    """
+
+    # Names the step in error logs
+    description = "Periodic task"
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+        self.errors_total = 0
+
+    @abstractmethod
+    async def tick(self): ...
+
+    async def run(self, delay: float = 0.0):
+        await asyncio.sleep(delay)
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors_total += 1
+                logging.error(f"{self.description} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, delay: float = 0.0):
+        self.task = asyncio.create_task(self.run(delay))
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
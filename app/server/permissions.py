@@ -0,0 +1,163 @@
+"""In-process cache of application permissions.
+
+The whole permission table is loaded at startup and then refreshed with the
+rows whose updated_at moved since the last refresh, so authorization checks
+are a dict lookup on (business_id, app_id) instead of a query.
+"""
+
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from core.exceptions import BaseHTTPException
+from fastapi import Request
+from server import auth
+from server.config import Settings
+from server.db import engine
+from server.periodic import PeriodicTask
+from sqlalchemy import Boolean, DateTime, Uuid, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+permission_query = """
+    SELECT uid, business_id, app_id, write_access, is_deleted, updated_at
+    FROM permission {where}
+    ORDER BY updated_at
+"""
+
+
+class PermissionResolver(PeriodicTask):
+    description = "Permission refresh"
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        interval: float = Settings.permission_refresh_interval,
+    ):
+        super().__init__(interval)
+        self.engine = engine
+        columns = dict(
+            uid=Uuid,
+            business_id=Uuid,
+            app_id=Uuid,
+            write_access=Boolean,
+            is_deleted=Boolean,
+            updated_at=DateTime,
+        )
+        self.load_query = text(permission_query.format(where="")).columns(**columns)
+        self.refresh_query = text(
+            permission_query.format(where="WHERE updated_at >= :since")
+        ).columns(**columns)
+        # (business_id, app_id) -> write_access
+        self.permissions: dict[tuple[uuid.UUID, uuid.UUID], bool] = {}
+        # (business_id, app_id) -> uid of the live row granting it
+        self.granted_by: dict[tuple[uuid.UUID, uuid.UUID], uuid.UUID] = {}
+        self.watermark: datetime | None = None
+        self.loaded = False
+
+    def apply(self, rows) -> None:
+        for uid, business_id, app_id, write_access, is_deleted, updated_at in rows:
+            key = (business_id, app_id)
+            if is_deleted:
+                # A key may also have older revoked rows; only the delete of
+                # the row that granted it revokes it
+                if self.granted_by.get(key) == uid:
+                    del self.permissions[key], self.granted_by[key]
+            else:
+                self.permissions[key] = write_access
+                self.granted_by[key] = uid
+            if self.watermark is None or updated_at > self.watermark:
+                self.watermark = updated_at
+
+    async def load(self) -> int:
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(self.load_query)).all()
+        self.permissions = {}
+        self.granted_by = {}
+        self.watermark = None
+        self.apply(rows)
+        self.loaded = True
+        return len(rows)
+
+    async def refresh(self) -> int:
+        if not self.loaded or self.watermark is None:
+            return await self.load()
+        # Re-read a window before the watermark, since a transaction can
+        # commit rows stamped earlier than rows already seen
+        since = self.watermark - timedelta(seconds=self.interval)
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(self.refresh_query, {"since": since})).all()
+        self.apply(rows)
+        return len(rows)
+
+    async def tick(self):
+        await self.refresh()
+
+    async def start(self):
+        """Load the whole table, then refresh it in the background."""
+        try:
+            await self.load()
+        except Exception as e:
+            # The refresh loop keeps retrying the full load
+            self.errors_total += 1
+            logging.error(f"Permission load failed: {e}")
+        super().start(delay=self.interval)
+
+    def check(self, business_id: uuid.UUID, app_id: uuid.UUID, write: bool = False):
+        write_access = self.permissions.get((business_id, app_id))
+        if write_access is None:
+            return False
+        return write_access or not write
+
+    def metrics(self) -> list[str]:
+        return [
+            "# TYPE permission_cache_entries gauge",
+            f"permission_cache_entries {len(self.permissions)}",
+            "# TYPE permission_cache_errors_total counter",
+            f"permission_cache_errors_total {self.errors_total}",
+        ]
+
+
+resolver = PermissionResolver(engine)
+
+
+def principal_app_id(principal) -> uuid.UUID | None:
+    """Application id from the verified token's `app_id` claim."""
+    claims = getattr(principal, "claims", None) or {}
+    try:
+        return uuid.UUID(str(claims["app_id"]))
+    except (KeyError, ValueError):
+        return None
+
+
+def require_permission(app_dependency, write: bool = False):
+    """Dependency checking the calling app's permission on the business.
+
+    The app is the principal `app_dependency` authenticates, identified by
+    its token's `app_id` claim, so a caller cannot claim another app's
+    grant. Only `business_id` comes from the path or the query string.
+    """
+
+    async def dependency(request: Request, business_id: uuid.UUID) -> bool:
+        principal = await auth.cached_user(app_dependency, request)
+        app_id = principal_app_id(principal)
+        if app_id is None:
+            raise BaseHTTPException(
+                status_code=401,
+                error="app_unauthenticated",
+                message="Request is not authenticated as an application",
+            )
+        if not resolver.loaded:
+            raise BaseHTTPException(
+                status_code=503,
+                error="permissions_unavailable",
+                message="Permissions are not loaded yet",
+            )
+        if not resolver.check(business_id, app_id, write):
+            raise BaseHTTPException(
+                status_code=403,
+                error="permission_denied",
+                message="Application has no permission on this business",
+            )
+        return True
+
+    return dependency
@@ -6,21 +6,66 @@ import fastapi
 import pydantic
 from core import exceptions
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from json_advanced import dumps
-from server import config, db
+from server import config, db, log, metrics, permissions
+from server.auth import JWKSRefresher
+from server.hold_expiry import HoldExpiryScheduler
+from server.idempotency_purge import IdempotencyPurger
 from usso.exceptions import USSOException
 
 
 @asynccontextmanager
 async def lifespan(app: fastapi.FastAPI):  # type: ignore
     """Initialize application services."""
-    await db.init_db()
-    config.Settings().config_logger()
-
-    logging.info("Startup complete")
+    # Every worker runs this; table creation must happen once
+    with metrics.startup_phase("db"):
+        async with db.startup_lock():
+            await db.init_db()
+    with metrics.startup_phase("logging"):
+        config.Settings().config_logger()
+        metrics.collectors.append(log.metrics)
+
+    with metrics.startup_phase("services"):
+        hold_expiry = None
+        if config.Settings.hold_expiry_enabled:
+            hold_expiry = HoldExpiryScheduler(db.engine)
+            hold_expiry.start()
+            metrics.collectors.append(hold_expiry.metrics)
+
+        idempotency_purge = IdempotencyPurger(db.engine)
+        idempotency_purge.start()
+        metrics.collectors.append(idempotency_purge.metrics)
+
+        await permissions.resolver.start()
+        metrics.collectors.append(permissions.resolver.metrics)
+
+        jwks = None
+        if config.Settings.jwks_url:
+            jwks = JWKSRefresher()
+            jwks.start()
+            metrics.collectors.append(jwks.metrics)
+
+    breakdown = ", ".join(
+        f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in metrics.startup.items()
+    )
+    logging.info(f"Startup complete ({breakdown})")
     yield
+
+    if jwks is not None:
+        await jwks.stop()
+        metrics.collectors.remove(jwks.metrics)
+    await permissions.resolver.stop()
+    metrics.collectors.remove(permissions.resolver.metrics)
+
+    await idempotency_purge.stop()
+    metrics.collectors.remove(idempotency_purge.metrics)
+    if hold_expiry is not None:
+        await hold_expiry.stop()
+        metrics.collectors.remove(hold_expiry.metrics)
     logging.info("Shutdown complete")
+    metrics.collectors.remove(log.metrics)
+    log.stop_queue()
 
 
 app = fastapi.FastAPI(
@@ -73,15 +118,22 @@ async def pydantic_exception_handler(
     )
 
 
-@app.exception_handler(Exception)
-async def general_exception_handler(request: fastapi.Request, exc: Exception):
-    import traceback
+tracebacks = log.TracebackLimiter(
+    config.Settings.traceback_limit, config.Settings.traceback_window
+)
 
-    traceback_str = "".join(traceback.format_tb(exc.__traceback__))
-    # body = request._body
 
-    logging.error(f"Exception: {traceback_str} {exc}")
-    logging.error(f"Exception on request: {request.url}")
+@app.exception_handler(Exception)
+async def general_exception_handler(request: fastapi.Request, exc: Exception):
+    # The traceback is formatted by the log listener, not on the loop
+    allowed, suppressed = tracebacks.allow(exc)
+    if allowed:
+        note = f" ({suppressed} similar suppressed)" if suppressed else ""
+        logging.error(
+            f"Exception on request: {request.url}: {exc}{note}", exc_info=exc
+        )
+    else:
+        logging.error(f"Exception on request: {request.url}: {exc!r}")
     # logging.error(f"Exception on request: {await request.body()}")
     return JSONResponse(
         status_code=500,
@@ -99,6 +151,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if db.replica_engine is not db.engine:
+    app.add_middleware(db.StickyPrimaryMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.instrument_engine(db.engine)
+if db.replica_engine is not db.engine:
+    metrics.instrument_engine(db.replica_engine)
 
 # from apps.note.routes import router as note_router
 
@@ -108,3 +167,13 @@ app.add_middleware(
 @app.get("/")
 async def index():
     return {"message": "Hello World!"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return metrics.render(db.pool_status())
+
+
+@app.get("/metrics/pool")
+async def pool_metrics():
+    return db.pool_status()
@@ -0,0 +1,145 @@
+"""Settlement of proposals into ledger transactions.
+
+A proposal moves `amount` from its `sources` to its `recipients`, both JSON
+lists of `{"wallet_id": ..., "amount": ...}` legs. Settling it claims the
+proposal, applies every wallet's net change through server.ledger, which
+locks wallets in uid order and stamps the rows, then writes all debit and
+credit rows with one bulk insert. Everything commits together or not at
+all.
+"""
+
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+
+from core.exceptions import BaseHTTPException
+from server import ledger
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    DateTime,
+    Numeric,
+    String,
+    Uuid,
+    bindparam,
+    column,
+    insert,
+    table,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+PENDING = "pending"
+SETTLED = "settled"
+
+transaction_table = table(
+    "transaction",
+    column("uid", Uuid),
+    column("wallet_id", Uuid),
+    column("amount", Numeric),
+    column("balance", Numeric),
+    column("description", String),
+    column("note", String),
+    column("business_id", Uuid),
+    column("owner_id", Uuid),
+    column("created_at", DateTime),
+    column("updated_at", DateTime),
+    column("is_deleted", Boolean),
+)
+
+# Only pending (or unset) proposals are settled, and only once
+claim_query = (
+    text(
+        """
+        UPDATE proposal SET status = :settled, updated_at = :now
+        WHERE uid = :uid AND is_deleted = false
+            AND COALESCE(status, :pending) = :pending
+        RETURNING amount, sources, recipients, description, note
+        """
+    )
+    .bindparams(bindparam("uid", type_=Uuid))
+    .columns(amount=Numeric, sources=JSON, recipients=JSON)
+)
+
+def invalid(message: str) -> BaseHTTPException:
+    return BaseHTTPException(status_code=400, error="invalid_proposal", message=message)
+
+
+def parse_legs(legs, name: str) -> list[tuple[uuid.UUID, Decimal]]:
+    if not isinstance(legs, list) or not legs:
+        raise invalid(f"Proposal {name} must be a non-empty list")
+    parsed = []
+    for leg in legs:
+        try:
+            wallet_id = uuid.UUID(str(leg["wallet_id"]))
+            amount = Decimal(str(leg["amount"]))
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            raise invalid(f"Each of the {name} needs a wallet_id and an amount")
+        if not amount.is_finite() or amount <= 0:
+            raise invalid(f"Proposal {name} amounts must be positive")
+        parsed.append((wallet_id, amount))
+    return parsed
+
+
+def validate(amount, sources, recipients) -> list[tuple[uuid.UUID, Decimal]]:
+    """Signed legs of a proposal, debits first."""
+    amount = Decimal(str(amount))
+    debits = parse_legs(sources, "sources")
+    credits = parse_legs(recipients, "recipients")
+    if sum(a for _, a in debits) != amount or sum(a for _, a in credits) != amount:
+        raise invalid("Sources and recipients must each add up to the amount")
+    return [(wallet_id, -a) for wallet_id, a in debits] + credits
+
+
+class SettlementEngine:
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    async def settle(self, proposal_id: uuid.UUID) -> list[dict]:
+        """Settle a proposal and return the ledger rows it wrote."""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        async with self.engine.begin() as conn:
+            proposal = (
+                await conn.execute(
+                    claim_query,
+                    {
+                        "uid": proposal_id,
+                        "now": now,
+                        "pending": PENDING,
+                        "settled": SETTLED,
+                    },
+                )
+            ).one_or_none()
+            if proposal is None:
+                raise BaseHTTPException(
+                    status_code=409,
+                    error="proposal_not_settleable",
+                    message="Proposal does not exist or is not pending",
+                )
+            legs = validate(proposal.amount, proposal.sources, proposal.recipients)
+
+            deltas = defaultdict(Decimal)
+            for wallet_id, amount in legs:
+                deltas[wallet_id] += amount
+            wallets = await ledger.move_balances(conn, deltas)
+            if len({wallet.currency for wallet in wallets.values()}) > 1:
+                raise invalid("All wallets of a proposal must share a currency")
+
+            rows = [
+                {
+                    "uid": uuid.uuid4(),
+                    "wallet_id": wallet_id,
+                    "amount": amount,
+                    "description": proposal.description,
+                    "note": proposal.note,
+                    "business_id": wallets[wallet_id].business_id,
+                    "owner_id": wallets[wallet_id].owner_id,
+                    "is_deleted": False,
+                }
+                for wallet_id, amount in legs
+            ]
+            ledger.stamp(rows, wallets)
+            await conn.execute(insert(transaction_table), rows)
+        await ledger.balances_moved(set(wallets))
+        return rows
@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """In-process LRU cache whose entries expire after `ttl` seconds.
+
+    With `weigh`, the summed weight of the entries is also kept within
+    `maxweight`, and a value heavier than that on its own is not stored.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60,
+        maxweight: int | None = None,
+        weigh: Callable[[Any], int] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def _weight(self, value: Any) -> int:
+        return self.weigh(value) if self.weigh is not None else 0
+
+    def _remove(self, key: Hashable) -> tuple[float, Any] | None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.weight -= self._weight(entry[1])
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        if ttl is None:
+            ttl = self.ttl
+        weight = self._weight(value)
+        self._remove(key)
+        if self.maxweight is not None and weight > self.maxweight:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self.weight += weight
+        while len(self._data) > self.maxsize or (
+            self.maxweight is not None and self.weight > self.maxweight
+        ):
+            self._remove(next(iter(self._data)))
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._remove(key)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.weight = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _missing) is not _missing
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_missing = object()